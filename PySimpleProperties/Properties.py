@@ -1,43 +1,400 @@
+from bisect import bisect_left
+import contextlib
 import copy
-from collections import KeysView, ValuesView
-from typing import Optional
+import functools
+from collections import OrderedDict
+import heapq
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import fnmatch
+import hashlib
+import itertools
+import logging
+import marshal
+import mmap
+from array import array
+from collections.abc import ItemsView, KeysView, Mapping, MutableMapping, ValuesView
+from typing import Callable, Optional
 import os
 import platform
+import re
+import stat
+import sys
+import threading
+import time
+import weakref
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+_event_hooks: list[Callable[[dict], None]] = []
+_versions = itertools.count(1)  ## Source of Properties versions, next() on it is atomic
+_temp_names = itertools.count()  ## Suffixes of the temporary files of atomic writes
+_last_version = [0]  ## Version of the last changed Properties object, lets LayeredProperties skip checking its layers
 
 
 #####     STATIC METHODS     #####
-def clean_path(uncleaned_path: str):
+def addEventHook(hook: Callable[[dict], None]):
+    """Registers a function called with a dict for every event, events have an 'event' key:
+    'loaded' (path, bytes, keys, duration in seconds, cached) when a Properties object loads a file,
+    'directory_updated' (path, added, changed, unchanged, removed, duration) when PropertiesHandler.updateDirectory ends,
+    'file_changed' (path, change: 'added', 'changed' or 'removed') when a DirectoryWatcher applied a change,
+    'flushed' (files, errors, duration) when PropertiesHandler.flushAll ends
+    :param hook: function taking the event dict
+    """
+    _event_hooks.append(hook)
+
+
+def removeEventHook(hook: Callable[[dict], None]):
+    """Unregisters a function added with addEventHook"""
+    _event_hooks.remove(hook)
+
+
+def _emit(event: dict, message: str):
+    """Logs an event (at DEBUG level, message is formatted with the event) and passes it to the hooks"""
+    logger.debug(message, event, extra={'properties_event': event})
+    for hook in _event_hooks:
+        try:
+            hook(event)
+        except Exception:
+            logger.exception('Event hook %r failed', hook)
+
+
+def _emitLoaded(prop: 'Properties', start: float, cached: bool = False):
+    if not _event_hooks and not logger.isEnabledFor(logging.DEBUG):
+        return
+    _emit({'event': 'loaded', 'path': prop.path, 'bytes': prop.stat_signature[1], 'keys': len(prop.content),
+           'duration': time.perf_counter() - start, 'cached': cached},
+          'Loaded %(path)s: %(bytes)d bytes, %(keys)d keys in %(duration).6fs')
+
+
+@functools.lru_cache(maxsize=4096)
+def clean_path(uncleaned_path: str) -> str:
     platformSeparator = getPlatformSeparators()
-    uncleaned_path = copy.deepcopy(uncleaned_path).replace('/', '\\')
-    if not uncleaned_path.endswith("\\"):
-        uncleaned_path += "\\"
-    struct_path = uncleaned_path.split('\\')
-    i = 0
-    _cleaner(struct_path, 0, first=True)
-    while i < len(struct_path):
-        if struct_path[i] == '..':
-            struct_path.pop(i)
-            struct_path.pop(i)
+    other_separator = '\\' if platformSeparator == '/' else '/'
+    if '..' not in uncleaned_path and other_separator not in uncleaned_path \
+            and platformSeparator * 2 not in uncleaned_path and not uncleaned_path.endswith(platformSeparator):
+        return uncleaned_path  ## Already normalized
+    struct_path = uncleaned_path.replace('/', '\\').split('\\')
+    ## A leading separator leaves an empty first element which is kept, other empty elements are dropped
+    struct_path = struct_path[:1] + [element for element in struct_path[1:] if element]
+    cleaned = []
+    skip_next = False
+    for element in struct_path:
+        if skip_next:
+            skip_next = False
+        elif element == '..':  ## Removes itself and the element after it
+            skip_next = True
+        else:
+            cleaned.append(element)
+    if not cleaned:
+        return platformSeparator
+    return platformSeparator.join(cleaned)
+
+
+def _parse_lines(lines, separator_char: str = '=', comment_char: str = '#',
+                 intern_keys: bool = False) -> tuple[dict, dict]:
+    """Parses .properties lines in a single pass, lines can be any iterable (an open file is read lazily)
+    :param lines: iterable of str lines
+    :param separator_char: separator_char (default:=)
+    :param comment_char: comment_char (default:#)
+    :param intern_keys: if True keys are interned, so that keys repeated across files share one string
+    :return: tuple (content, comments), comments are keyed by line number
+    """
+    content = {}
+    comments = {}
+    key = None
+    parts = []  ## Pieces of a multi-line value, joined once the value ends
+    for index, line in enumerate(lines):
+        line = line.strip()
+        if not line:
+            continue
+        continued = line[-1] == '\\'
+        if key is not None:
+            parts.append(line.replace('\\', '') if continued else line)
+        elif line[0] != comment_char:
+            key, key_value = line.split(separator_char)
+            if intern_keys:
+                key = sys.intern(key)
+            parts.append(key_value.replace('\\', '') if continued else key_value)
         else:
-            i += 1
-    path = struct_path[0] if struct_path else platformSeparator
+            comments[index] = line[1:].strip()
+            continue
+        if not continued:
+            content[key] = parts[0] if len(parts) == 1 else ' '.join(parts)
+            key = None
+            parts = []
+    if key is not None:
+        content[key] = ' '.join(parts)
+    return content, comments
+
+
+def _write_file(path: str, data, atomic: bool = False, fsync: bool = True):
+    """Writes data (str or bytes) to path in a single write
+    :param atomic: if True data is written to a temporary file in the same directory which then replaces path
+    :param fsync: if atomic, flushes the temporary file to disk before replacing path
+    """
+    mode = 'wb' if isinstance(data, bytes) else 'w'
+    if not atomic:
+        with open(path, mode) as f:
+            f.write(data)
+        return
+    fd, tmp_path = _open_temp(path)
+    try:
+        if os.path.exists(path):
+            os.chmod(tmp_path, stat.S_IMODE(os.stat(path).st_mode))
+        with os.fdopen(fd, mode) as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class _Entries:
+    """Byte ranges of the entries of a file, kept up to date while writeBack patches it. Entries are numbered in file
+    order and a Fenwick tree sums their size changes, so that finding where an entry moved to is O(log n)"""
+    __slots__ = ('index', 'keys', 'starts', 'sizes', 'tree', 'duplicates', 'open_end')
+
+    def __init__(self):
+        self.index = {}  ## key -> entry number, of its last occurrence
+        self.keys = []  ## Key of each entry
+        self.starts = array('q')  ## Start of each entry, minus the size changes of the entries before it
+        self.sizes = array('q')
+        self.tree = array('q', [0])  ## Fenwick tree of the size changes, 1-based
+        self.duplicates = set()  ## Keys found more than once in the file
+        self.open_end = False  ## True if the file ends inside a multi-line value
+
+    def _shift(self, entry: int) -> int:
+        """:return: size change of the entries before entry"""
+        shift = 0
+        while entry > 0:
+            shift += self.tree[entry]
+            entry &= entry - 1
+        return shift
+
+    def add(self, key: str, start: int, size: int):
+        """Adds an entry after every other one"""
+        entry = len(self.sizes)
+        shift = self._shift(entry)
+        position = entry + 1
+        ## New Fenwick node covering the entries (position - lowbit, position], its own size change is 0
+        self.tree.append(shift - self._shift(position & (position - 1)))
+        if key in self.index:
+            self.duplicates.add(key)
+        self.index[key] = entry
+        self.keys.append(key)
+        self.starts.append(start - shift)
+        self.sizes.append(size)
+
+    def entries(self, key: str) -> list[int]:
+        """:return: numbers of the entries of key, in file order"""
+        if key not in self.duplicates:
+            return [self.index[key]]
+        return [entry for entry, other in enumerate(self.keys) if other == key and self.sizes[entry]]
+
+    def range(self, entry: int) -> tuple[int, int]:
+        start = self.starts[entry] + self._shift(entry)
+        return start, start + self.sizes[entry]
+
+    def resize(self, entry: int, size: int):
+        """Changes the size of an entry, every entry after it moves, a size of 0 removes it"""
+        delta = size - self.sizes[entry]
+        self.sizes[entry] = size
+        position = entry + 1
+        while position < len(self.tree):
+            self.tree[position] += delta
+            position += position & -position
+
+    def last(self) -> Optional[int]:
+        """:return: number of the last entry of the file, None if it has none"""
+        for entry in range(len(self.sizes) - 1, -1, -1):
+            if self.sizes[entry]:
+                return entry
+        return None
+
+
+def _prefixEnd(prefix: str) -> Optional[str]:
+    """:return: smallest string greater than every string starting with prefix, None if there is none"""
+    prefix = prefix.rstrip(chr(sys.maxunicode))
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1) if prefix else None
+
+
+class _KeyIndex:
+    """Sorted keys of a Properties object. Keys added and removed since it was sorted are kept in two sets, which
+    are merged in by the first query once they hold more than a small part of the keys"""
+    __slots__ = ('keys', 'added', 'removed')
+
+    def __init__(self, keys):
+        self.keys = sorted(keys)
+        self.added = set()  ## Keys missing from self.keys
+        self.removed = set()  ## Keys still in self.keys
+
+    def pending(self) -> int:
+        return len(self.added) + len(self.removed)
+
+    def _has(self, key: str) -> bool:
+        i = bisect_left(self.keys, key)
+        return i < len(self.keys) and self.keys[i] == key
+
+    def update(self, key: str, present: bool):
+        if present:
+            if key in self.removed:
+                self.removed.discard(key)
+            elif not self._has(key):
+                self.added.add(key)
+        elif key in self.added:
+            self.added.discard(key)
+        elif self._has(key):
+            self.removed.add(key)
+
+    def _merge(self):
+        removed = self.removed
+        keys = [key for key in self.keys if key not in removed] if removed else self.keys
+        keys.extend(self.added)
+        keys.sort()  ## Two sorted runs, merged in linear time
+        self.keys, self.added, self.removed = keys, set(), set()
+
+    def range(self, prefix: str) -> list[str]:
+        """:return: sorted keys starting with prefix"""
+        if self.pending() > max(256, len(self.keys) >> 8):
+            self._merge()
+        keys = self.keys
+        start = bisect_left(keys, prefix)
+        end = _prefixEnd(prefix)
+        found = keys[start:len(keys) if end is None else bisect_left(keys, end, start)]
+        if self.removed:
+            found = [key for key in found if key not in self.removed]
+        if self.added:
+            added = [key for key in self.added if key.startswith(prefix)]
+            if added:
+                found.extend(added)
+                found.sort()
+        return found
+
+
+def _scan_offsets(f, separator: bytes, comment: bytes) -> _Entries:
+    """Finds the byte range of every entry of a file opened in binary mode, follows the same rules as _parse_lines"""
+    entries = _Entries()
+    key, key_start, pos = None, 0, 0
+    for raw in f:
+        start = pos
+        pos += len(raw)
+        line = raw.strip()
+        if not line:
+            continue
+        if key is None:
+            if line.startswith(comment):
+                continue
+            key, key_start = line.split(separator, 1)[0].decode(), start
+        if not line.endswith(b'\\'):
+            entries.add(key, key_start, pos - key_start)
+            key = None
+    if key is not None:
+        entries.add(key, key_start, pos - key_start)
+        entries.open_end = True
+    return entries
+
+
+def _fsync(path: str) -> Optional[OSError]:
+    """Flushes a file or directory to disk
+    :return: the error raised, if any
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    except OSError as e:
+        return e
+    return None
+
+
+def _open_temp(path: str) -> tuple[int, str]:
+    """Creates a new temporary file in the directory of path, with the mode open() gives new files
+    (0o666 minus the umask, applied by the OS)
+    :return: tuple (file descriptor, path of the temporary file)
+    """
+    directory, name = os.path.split(path)
+    while True:
+        tmp_path = os.path.join(directory, f'.{name}.{os.getpid()}.{next(_temp_names)}.tmp')
+        try:
+            return os.open(tmp_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY | getattr(os, 'O_BINARY', 0), 0o666), \
+                tmp_path
+        except FileExistsError:  ## Left by a crashed process with the same pid
+            continue
 
-    for element in struct_path[1:]:
-        if element != '':
-            path += platformSeparator + element
-    return path
 
+def _stat_signature(st: os.stat_result) -> tuple:
+    """Signature used to tell if a file changed since it was loaded: (mtime_ns, size, inode)"""
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+def _hashed_lines(lines, digest):
+    """Yields lines unchanged while feeding them to digest"""
+    for line in lines:
+        digest.update(line.encode())
+        yield line
+
+
+def _file_hash(path: str) -> bytes:
+    """Hashes the text content of a file, matches the digest built by _hashed_lines while loading"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'r') as f:
+        for chunk in iter(lambda: f.read(1 << 16), ''):
+            digest.update(chunk.encode())
+    return digest.digest()
+
+
+_CACHE_VERSION = 1
+
+
+def _cachePath(cache_dir: str, path: str) -> str:
+    """Path of the cache file of a .properties file inside cache_dir"""
+    return os.path.join(cache_dir, hashlib.blake2b(path.encode(), digest_size=16).hexdigest() + '.cache')
 
-def _cleaner(struct_path: list, index: int, first=False):
-    if index == len(struct_path):
-        return
-    if (not first) and struct_path[index] == "":
-        struct_path.pop(index)
-        return _cleaner(struct_path, index)
-    return _cleaner(struct_path, index + 1)
 
+def _readCache(cache_path: str) -> dict:
+    """Reads a cache or snapshot file
+    :return: dict of absolute path -> (stat_signature, separator_char, comment_char, content, comments),
+    empty if the file is missing or unreadable
+    """
+    try:
+        with open(cache_path, 'rb') as f:
+            version, entries = marshal.loads(f.read())
+    except (OSError, EOFError, ValueError, TypeError):
+        return {}
+    if version != _CACHE_VERSION or not isinstance(entries, dict):
+        return {}
+    return entries
 
+
+def _writeCache(cache_path: str, entries: dict):
+    """Writes a cache or snapshot file, see _readCache for the entries format"""
+    try:
+        os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+        _write_file(cache_path, marshal.dumps((_CACHE_VERSION, entries)), atomic=True, fsync=False)
+    except OSError as e:
+        logger.warning("Could not write cache file '%s': %s", cache_path, e)
+
+
+_BOOLEANS = {'true': True, 'yes': True, 'on': True, '1': True, 'false': False, 'no': False, 'off': False, '0': False}
+
+
+def _toBool(value: str) -> bool:
+    try:
+        return _BOOLEANS[value.strip().lower()]
+    except KeyError:
+        raise ValueError(value) from None
+
+
+@functools.cache
 def getPlatformSeparators():
+    ## Resolved on first call then shared by every object and helper, unsupported platforms raise on each call
     system = platform.system()
     if system == 'Linux':
         return '/'
@@ -49,14 +406,95 @@ def getPlatformSeparators():
         raise SystemError(f'Platform {system} not supported!')
 
 
+class _OverlayContent(MutableMapping):
+    """Content of a cloned Properties object: reads fall through to the shared base content, keys set or removed on
+    the clone are stored in the overlay only, so memory grows with the changes and not with the base"""
+
+    def __init__(self, base: Mapping):
+        self.base = base
+        self.overrides = {}
+        self.removed = set()  ## Base keys removed from the clone
+        self._added = 0  ## Number of overrides which are not base keys
+
+    def __getitem__(self, key: str) -> str:
+        try:
+            return self.overrides[key]
+        except KeyError:
+            if key in self.removed:
+                raise
+        return self.base[key]
+
+    def get(self, key: str, default=None):
+        value = self.overrides.get(key, self)
+        if value is not self:
+            return value
+        if key in self.removed:
+            return default
+        return self.base.get(key, default)
+
+    def __contains__(self, key) -> bool:
+        return key in self.overrides or (key not in self.removed and key in self.base)
+
+    def __setitem__(self, key: str, value: str):
+        if key not in self.overrides:
+            if key in self.removed:
+                self.removed.discard(key)
+            elif key not in self.base:
+                self._added += 1
+        self.overrides[key] = value
+
+    def __delitem__(self, key: str):
+        in_base = key not in self.removed and key in self.base
+        if key in self.overrides:
+            del self.overrides[key]
+            if not in_base:
+                self._added -= 1
+        elif not in_base:
+            raise KeyError(key)
+        if in_base:
+            self.removed.add(key)
+
+    def __iter__(self):
+        ## Base keys keep their position, even when overridden, new keys come after them
+        removed = self.removed
+        for key in self.base:
+            if key not in removed:
+                yield key
+        if self._added:
+            base = self.base
+            for key in self.overrides:
+                if key in removed or key not in base:
+                    yield key
+
+    def __len__(self) -> int:
+        return len(self.base) - len(self.removed) + self._added
+
+    def copy(self) -> '_OverlayContent':
+        overlay = _OverlayContent(self.base)
+        overlay.overrides, overlay.removed, overlay._added = self.overrides.copy(), self.removed.copy(), self._added
+        return overlay
+
+
 class Properties:
     content: dict
     comments: dict   ## Key is line number
     path: str  ## self.path is absolute
-    prev_key: str
+    stat_signature: Optional[tuple]  ## (mtime_ns, size, inode) of the file when it was last loaded
+    content_hash: Optional[bytes]  ## Only set when loaded with hash_content=True
+    cache_dir: Optional[str]  ## Directory where parsed files are cached, None to disable caching
+    intern_keys: bool
     comment_char: str
     separator_char: str
-    platformSeparator: str
+    _content_shared: bool  ## True once clones read through content, it is then copied before being changed
+    _version: int  ## Changed by every load and change of the content through methods
+    _typed: Optional[dict]  ## Values converted by the typed getters: key -> {type or list delimiter: value}
+    _listeners: Optional[list]  ## Functions called with (self, key) by _changed, see Interpolator
+    _dirty: Optional[set]  ## Keys set, replaced or removed since the file was loaded or written back
+    _offsets: Optional['_Entries']  ## Byte ranges of the entries in the file, found by writeBack
+    _key_index: Optional['_KeyIndex']  ## Sorted keys, built by the first prefix query
+    __slots__ = ('content', 'comments', 'path', 'stat_signature', 'content_hash', 'cache_dir', 'intern_keys',
+                 'comment_char', 'separator_char', '_content_shared', '_version', '_typed', '_listeners', '_dirty',
+                 '_offsets', '_key_index', '__weakref__')
 
     def __init__(self, path: str = False, **kwargs):
         """ Creates a Properties object used to manage a .properties file
@@ -64,14 +502,27 @@ class Properties:
         :key separator_char: properties file separator character (default:=)
         :key comment_char: properties file comment character (default:#)
         :key is_absolute: boolean of whether or not the path given is absolute
+        :key cache_dir: directory where the parsed file is cached, later loads of the unchanged file read the cache
+        instead of parsing it again (default:None, no cache)
+        :key intern_keys: if True keys are interned, so that keys repeated across many files share one string
+        (default:False)
         """
         self.content = {}
         self.comments = {}
+        self._content_shared = False
+        self._version = 0
+        self._typed = None
+        self._listeners = None
+        self._dirty = None
+        self._offsets = None
+        self._key_index = None
         self.path = ''
-        self.prev_key = ''
+        self.stat_signature = None
+        self.content_hash = None
+        self.cache_dir = kwargs.get('cache_dir', None)
+        self.intern_keys = kwargs.get('intern_keys', False)
         self.separator_char = kwargs.get('separator_char', '=')
         self.comment_char = kwargs.get('comment_char', '#')
-        self.platformSeparator = getPlatformSeparators()
         is_absolute: bool = kwargs.get('is_absolute', False)
         if path:
             self.load(path, self.separator_char, self.comment_char, is_absolute)
@@ -79,6 +530,24 @@ class Properties:
     def __repr__(self):
         return f"<{self.__class__}, loaded_file: '{self.path if self.path else 'None'}'>"
 
+    def __getstate__(self):
+        ## Slots read through their descriptors, which doesn't parse a LazyProperties file through __getattr__
+        state = {}
+        for cls in type(self).__mro__:
+            for name in cls.__dict__.get('__slots__', ()):
+                if name != '__weakref__':
+                    try:
+                        state[name] = getattr(cls, name).__get__(self)
+                    except AttributeError:
+                        pass
+        state['_listeners'] = None  ## Copies and pickles don't carry the interpolators along
+        state['_key_index'] = None  ## Built again when needed
+        return None, state
+
+    @property
+    def platformSeparator(self) -> str:
+        return getPlatformSeparators()
+
     def getPath(self) -> str:
         """Used to get the path of the file stored
         :return: str, the path of the file stored
@@ -86,57 +555,105 @@ class Properties:
         return self.path
 
     def load(self, path: str, separator_char: str = '=', comment_char: str = '#',
-             is_absolute: bool = False) -> 'Properties':
+             is_absolute: bool = False, hash_content: bool = False) -> 'Properties':
         """ Loads Properties and stores them in a dict and returns the dict
         :param path: string path as relative {used with a context manager}
         :param comment_char: comment_char (default:#)
         :param separator_char: separator_char (default:=)
         :param is_absolute: boolean of whether or not the path given is absolute
+        :param hash_content: if True also stores a hash of the file content, used by isModified(check_hash=True)
         :return: Dict of content
         """
-        print(f'-> Loading file: {path}')
+        logger.debug('Loading file: %s', path)
+        start = time.perf_counter()
         if not is_absolute:
             path = str(os.getcwd()) + self.platformSeparator + clean_path(path)
         path = clean_path(path)
-        self.content = {}
-        self.prev_key = ''
+        use_cache = self.cache_dir and not hash_content
         try:
+            if use_cache and self._loadCached(path, separator_char, comment_char):
+                _emitLoaded(self, start, cached=True)
+                return self
             with open(path, 'r') as f:
-                strContent = f.readlines()
-                for index, line in enumerate(strContent):
-                    line = line.replace('\n', '').strip()
-                    if not line:
-                        continue
-                    if self.prev_key != '':
-                        self.content[self.prev_key] += ' ' + line
-
-                    elif line[0] != comment_char:
-                        key, key_value = line.split(separator_char)
-                        self.content[key] = key_value
-
-                    elif line[0] == comment_char:
-                        self.comments[index] = line[1:].strip()
-
-                    if line[-1] == '\\':
-                        self.prev_key = key if self.prev_key == '' else self.prev_key
-                        self.content[key] = self.content[key].replace('\\', '')
-                    if line[-1] != '\\' and self.prev_key != '':
-                        self.prev_key = ''
-
-                f.close()
-            self.prev_key = ''
+                signature = _stat_signature(os.fstat(f.fileno()))
+                digest = hashlib.blake2b(digest_size=16) if hash_content else None
+                lines = _hashed_lines(f, digest) if hash_content else f
+                self.content, self.comments = _parse_lines(lines, separator_char, comment_char, self.intern_keys)
+            self._content_shared = False
+            self.stat_signature = signature
+            self.content_hash = digest.digest() if hash_content else None
             self.path = path
             self.separator_char = separator_char
             self.comment_char = comment_char
+            self._changed()  ## Listeners may read the new path
+            if use_cache:
+                _writeCache(_cachePath(self.cache_dir, path), {path: self._cacheEntry()})
+            _emitLoaded(self, start)
         except FileNotFoundError as e:
             print(e)
         return self
 
-    def reload(self):
-        """Reloads the property file"""
+    def _loadCached(self, path: str, separator_char: str, comment_char: str) -> bool:
+        """Restores the content from cache_dir if the cached file didn't change since
+        :return: True if the content was restored
+        """
+        entry = _readCache(_cachePath(self.cache_dir, path)).get(path)
+        if entry is None or entry[1:3] != (separator_char, comment_char) \
+                or entry[0] != _stat_signature(os.stat(path)):
+            return False
+        self._restore(path, entry)
+        return True
+
+    def _cacheEntry(self) -> tuple:
+        """Entry stored in cache and snapshot files, restored with _restore"""
+        return self.stat_signature, self.separator_char, self.comment_char, self.content, self.comments
+
+    def _restore(self, path: str, entry: tuple):
+        """Sets the state of a file loaded from path from its cache entry"""
+        self.stat_signature, self.separator_char, self.comment_char, content, self.comments = entry
+        self.content = {sys.intern(key): value for key, value in content.items()} if self.intern_keys else content
+        self._content_shared = False
+        self.content_hash = None
+        self.path = path
+        self._changed()
+
+    def reload(self, only_if_modified: bool = False, check_hash: bool = False) -> bool:
+        """Reloads the property file
+        :param only_if_modified: if True the file is only reloaded when isModified() says it changed
+        :param check_hash: compare content hashes instead of stat signatures (for filesystems with coarse mtimes),
+        a file loaded without hash_content is reloaded once to store its hash
+        :return: True if the file was reloaded, False if it didn't change or could not be read (the content is kept)
+        """
         if not self.path:
-            return print("No path given, cannot reload properties. Skipping...")
-        self.load(self.path, self.separator_char, self.comment_char, is_absolute=True)
+            print("No path given, cannot reload properties. Skipping...")
+            return False
+        if only_if_modified and not self.isModified(check_hash):
+            return False
+        version = self._version
+        self.load(self.path, self.separator_char, self.comment_char, is_absolute=True,
+                  hash_content=check_hash or self.content_hash is not None)
+        return self._version != version  ## A successful load always changes the version
+
+    def isModified(self, check_hash: bool = False) -> bool:
+        """Used to know if the file changed on disk since it was last loaded
+        :param check_hash: if True compares content hashes instead of stat signatures, if no hash was stored at load
+        (see hash_content) the file is reported as modified, reload(check_hash=True) then stores one
+        :return: True if the file changed, was removed or was never loaded
+        """
+        if not self.path or self.stat_signature is None:
+            return True
+        try:
+            if check_hash:
+                if self.content_hash is None:
+                    return True
+                signature = _stat_signature(os.stat(self.path))
+                if _file_hash(self.path) != self.content_hash:
+                    return True
+                self.stat_signature = signature
+                return False
+            return _stat_signature(os.stat(self.path)) != self.stat_signature
+        except FileNotFoundError:
+            return True
 
     def getProperty(self, key: str) -> str:
         """Returns the key
@@ -145,6 +662,71 @@ class Properties:
         """
         return self.content.get(key, 'Undefined')
 
+    def _getTyped(self, key: str, kind, convert, default):
+        """Converts the value of key with convert and caches it, the typed getters first try the cache themselves
+        :param kind: what the value is converted to, the cache key next to key
+        """
+        version = self._version
+        value = self.content.get(key)  ## May load a LazyProperties, which empties the cache
+        if value is None:
+            return default
+        try:
+            result = convert(value)
+        except ValueError:
+            raise ValueError(f"Property {key}={value!r} is not a valid {getattr(kind, '__name__', 'list')}") from None
+        typed = self._typed
+        if typed is None:
+            typed = self._typed = {}
+        cached = typed.setdefault(key, {})
+        cached[kind] = result
+        if self._version != version:  ## Changed by another thread meanwhile, result may come from the old content
+            cached.pop(kind, None)
+        return result
+
+    def getInt(self, key: str, default: Optional[int] = None) -> Optional[int]:
+        """Returns the value of key as an int, raises a ValueError if it isn't one
+        :param key: str, key of dict
+        :param default: returned if the key is not found
+        """
+        try:
+            return self._typed[key][int]
+        except (TypeError, KeyError):  ## No cache yet or not cached
+            return self._getTyped(key, int, int, default)
+
+    def getFloat(self, key: str, default: Optional[float] = None) -> Optional[float]:
+        """Returns the value of key as a float, raises a ValueError if it isn't one
+        :param key: str, key of dict
+        :param default: returned if the key is not found
+        """
+        try:
+            return self._typed[key][float]
+        except (TypeError, KeyError):  ## No cache yet or not cached
+            return self._getTyped(key, float, float, default)
+
+    def getBool(self, key: str, default: Optional[bool] = None) -> Optional[bool]:
+        """Returns the value of key as a bool: true, yes, on and 1 are True, false, no, off and 0 are False
+        (case insensitive), raises a ValueError for other values
+        :param key: str, key of dict
+        :param default: returned if the key is not found
+        """
+        try:
+            return self._typed[key][bool]
+        except (TypeError, KeyError):  ## No cache yet or not cached
+            return self._getTyped(key, bool, _toBool, default)
+
+    def getList(self, key: str, delimiter: str = ',', default: Optional[list] = None) -> Optional[list[str]]:
+        """Returns the value of key split on delimiter, items are stripped and empty ones dropped.
+        The list is cached and shared by every call, it must not be modified
+        :param key: str, key of dict
+        :param delimiter: str separating the items (default:,)
+        :param default: returned if the key is not found
+        """
+        try:
+            return self._typed[key][delimiter]
+        except (TypeError, KeyError):
+            return self._getTyped(key, delimiter, lambda value: [item.strip() for item in value.split(delimiter)
+                                                                 if item.strip()], default)
+
     def replaceProperty(self, key: str, val: str, create_if_needed: bool = False):
         """Used to change the value of an existing property
         :param key: str, key to change value from
@@ -153,7 +735,9 @@ class Properties:
         :return:
         """
         if self.containsProperty(key) or create_if_needed:
+            self._ownContent()
             self.content[key] = val
+            self._changed(key)
         else:
             print(f"Undefined property {key}")
 
@@ -161,6 +745,8 @@ class Properties:
         """Returns the full content as a dict
         :return: dict, content of property file
         """
+        if isinstance(self.content, _OverlayContent):  ## Clones become a plain dict once their whole content is used
+            self.content = dict(self.content)
         return self.content
 
     def setProperty(self, key: str, val: any):
@@ -169,18 +755,63 @@ class Properties:
         :param val:  str, value for key
         :return:
         """
-        self.content[key] = str(val)
+        self._ownContent()
+        self.content[sys.intern(key) if self.intern_keys else key] = str(val)
+        self._changed(key)
+
+    def _changed(self, key: str = None):
+        """Called after the content changed, key is the only key changed or None if all of it may have changed"""
+        self._version = _last_version[0] = next(_versions)
+        if key is None:  ## Only loads and clear change the whole content, it then matches the file
+            self._dirty = self._offsets = None
+        elif self._dirty is None:
+            self._dirty = {key}
+        else:
+            self._dirty.add(key)
+        if self._typed is not None:
+            if key is None:
+                self._typed = None
+            else:
+                self._typed.pop(key, None)
+        index = self._key_index
+        if index is not None:
+            if key is None or index.pending() > len(index.keys):  ## Sorting the content again is then cheaper
+                self._key_index = None
+            else:
+                index.update(key, key in self.content)
+        if self._listeners:
+            for listener in tuple(self._listeners):  ## Listeners may remove themselves
+                listener(self, key)
+
+    def _ownContent(self):
+        """Copies the content before it is changed if clones read through it"""
+        if self._content_shared:
+            self.content = self.content.copy()
+            self._content_shared = False
 
     def clone(self) -> 'Properties':
-        """Used to clone the <Properties> object
-        :return: copy of self
+        """Used to clone the <Properties> object in constant time: the clone reads through the content of self and
+        only stores the keys set, replaced or removed on it. Changing self through its methods afterwards copies its
+        content first, so the clone keeps the content it was made from. getContent() on the clone copies the content
+        into a dict of its own
+        :return: copy of self, a Properties object
         """
-        return copy.deepcopy(self)
+        clone = Properties(separator_char=self.separator_char, comment_char=self.comment_char,
+                           cache_dir=self.cache_dir, intern_keys=self.intern_keys)
+        clone.content = _OverlayContent(self.content)
+        clone.comments = self.comments  ## Comments are only replaced as a whole, never changed in place
+        clone.path, clone.stat_signature, clone.content_hash = self.path, self.stat_signature, self.content_hash
+        self._content_shared = True
+        return clone
 
     def clear(self):
         """Clears the content stored and the path of the file"""
         self.path = ''
         self.content = {}
+        self._content_shared = False
+        self._changed()
+        self.stat_signature = None
+        self.content_hash = None
 
     def getKeySet(self) -> KeysView:
         """
@@ -199,7 +830,67 @@ class Properties:
         :param key: key to be removed
         :return: the value of the removed key
         """
-        return self.content.pop(key)
+        self._ownContent()
+        value = self.content.pop(key)
+        self._changed(key)
+        return value
+
+    def _keyIndex(self) -> _KeyIndex:
+        content = self.content  ## Parses the file of a LazyProperties first, which drops the index
+        if self._key_index is None:
+            self._key_index = _KeyIndex(content)
+        return self._key_index
+
+    def getKeysByPrefix(self, prefix: str) -> list[str]:
+        """Used to get the keys starting with prefix, the keys are sorted on the first call and the order is kept up
+        to date by setProperty, replaceProperty and removeProperty, so that later calls are O(log n + found keys)
+        :param prefix: str, pass 'db.pool.' to get the keys under the db.pool namespace only
+        :return: sorted list of keys
+        """
+        return self._keyIndex().range(prefix)
+
+    def getByPrefix(self, prefix: str) -> dict[str, str]:
+        """Used to get the properties whose key starts with prefix, see getKeysByPrefix
+        :param prefix: str, start of the keys
+        :return: dict of key -> value, in key order
+        """
+        content = self.content
+        return {key: content[key] for key in self._keyIndex().range(prefix)}
+
+    def getTree(self, prefix: str = '', separator: str = '.') -> dict:
+        """Used to get the properties under a namespace as nested dicts,
+        e.g. getTree('db') -> {'pool': {'size': '10', 'timeout': '30'}} for the keys db.pool.size and db.pool.timeout.
+        A key which is also a namespace (a and a.b) has its value stored under '' in the dict of the namespace
+        :param prefix: str, namespace to get, without the trailing separator, '' for every key
+        :param separator: str, separator of the namespaces in keys
+        :return: nested dicts of str
+        """
+        content = self.content
+        start = len(prefix) + len(separator) if prefix else 0
+        tree = {}
+        for key in self._keyIndex().range(prefix + separator if prefix else ''):
+            *path, leaf = key[start:].split(separator)
+            node = tree
+            for part in path:
+                child = node.setdefault(part, {})
+                if not isinstance(child, dict):
+                    child = node[part] = {'': child}
+                node = child
+            if isinstance(node.get(leaf), dict):
+                node[leaf][''] = content[key]
+            else:
+                node[leaf] = content[key]
+        return tree
+
+    def matchKeys(self, pattern: str) -> list[str]:
+        """Used to get the keys matching a glob pattern (see fnmatch, case-sensitive and * also matches the
+        separator). Only the keys starting with the part of the pattern before its first wildcard are tested
+        :param pattern: str, e.g. 'db.*.timeout' or 'cache.redis?.host'
+        :return: sorted list of keys
+        """
+        literal = re.split(r'[*?\[]', pattern, maxsplit=1)[0]
+        match = re.compile(fnmatch.translate(pattern)).match
+        return [key for key in self._keyIndex().range(literal) if match(key)]
 
     def containsProperty(self, key: str) -> bool:
         """Used to test if the property file contains a certain key
@@ -209,7 +900,7 @@ class Properties:
         return self.content.__contains__(key)
 
     def out(self, path: str = None, separator_char: str = '=', comment_char: str = '#', comments=None,
-            comments_pos: str = 'top', is_absolute: bool = False):
+            comments_pos: str = 'top', is_absolute: bool = False, atomic: bool = False, fsync: bool = True):
         """Used to write a properties file
         :param path: string path as relative {used with a context manager}
         :param comment_char: comment_char (default:#)
@@ -218,6 +909,8 @@ class Properties:
         :type comments: list[str]
         :param comments_pos: position of the comments, must be 'top' or 'bottom'
         :param is_absolute: boolean of whether or not the path given is absolute
+        :param atomic: if True writes to a temporary file then renames it, readers never see a half-written file
+        :param fsync: if atomic, flushes the temporary file to disk before renaming it
         """
         if path is None:
             if self.path == '':
@@ -232,55 +925,951 @@ class Properties:
         elif not hasattr(comments, '__iter__'):
             return print(f"Comments type is not valid: not iterable. Given={comments.__class__} | Should be a list")
 
-        with open(path, 'w') as f:
-            if comments and comments_pos == 'top':
-                for comment in comments:
-                    f.write(comment_char + ' ' + comment + '\n')
-            lineNumber, keyIndex, lastComIndex = 0, 0, 0
-            while keyIndex < len(self.content.keys()):
-                if self.comments.__contains__(lineNumber):
-                    f.write(comment_char+' '+self.comments.get(lineNumber)+'\n')
-                    lastComIndex += 1
-                else:
-                    key = list(self.content.keys())[keyIndex]
-                    f.write(key + separator_char + self.content[key] + '\n')
-                    keyIndex += 1
-                lineNumber += 1
+        lines = []
+        if comments and comments_pos == 'top':
+            lines.extend(comment_char + ' ' + comment for comment in comments)
+        items = iter(self.content.items())
+        remaining, lineNumber, lastComIndex = len(self.content), 0, 0
+        while remaining:
+            comment = self.comments.get(lineNumber)
+            if comment is not None:
+                lines.append(comment_char + ' ' + comment)
+                lastComIndex += 1
+            else:
+                key, value = next(items)
+                lines.append(key + separator_char + value)
+                remaining -= 1
+            lineNumber += 1
 
-            if len(self.comments.keys()) > lastComIndex:
-                for key in list(self.comments.keys())[lastComIndex:]:
-                    f.write(comment_char + ' ' + self.comments.get(key) + '\n')
+        if len(self.comments) > lastComIndex:
+            lines.extend(comment_char + ' ' + comment
+                         for comment in itertools.islice(self.comments.values(), lastComIndex, None))
 
-            if comments and comments_pos == 'bottom':
-                for comment in comments:
-                    f.write(comment_char + ' ' + comment + '\n')
-            f.close()
+        if comments and comments_pos == 'bottom':
+            lines.extend(comment_char + ' ' + comment for comment in comments)
+        _write_file(path, '\n'.join(lines) + '\n' if lines else '', atomic, fsync)
 
-    def close(self, comments=None):
+    def close(self, comments=None, atomic: bool = False):
         """Writes file to its path (Basically updates it) and clears the property so that it can be reused"""
-        self.out(self.path, self.separator_char, self.comment_char, comments, comments_pos='top', is_absolute=True)
+        self.out(self.path, self.separator_char, self.comment_char, comments, comments_pos='top', is_absolute=True,
+                 atomic=atomic)
         self.clear()
 
+    def hasChanges(self) -> bool:
+        """Used to know if keys were set, replaced or removed since the file was loaded or written back"""
+        return bool(self._dirty)
+
+    def writeBack(self, fsync: bool = True) -> str:
+        """Writes the keys set, replaced or removed since the file was loaded to it with as little I/O as possible:
+        changed lines are patched, new keys appended and removed ones deleted, the rest of the file keeps its
+        formatting. The file is patched in place, from its first changed line to its end, unless that is most of the
+        file: the unchanged start and the patched end are then written to a new file which replaces it. Only if the
+        file changed on disk since it was loaded is it rewritten from the content (see out)
+        :param fsync: if True flushes the file to disk
+        :return: 'unchanged', 'appended', 'patched' or 'rewritten'
+        """
+        if not self.path:
+            logger.warning('writeBack: no path set, skipping')
+            return 'unchanged'
+        if not self._dirty:
+            return 'unchanged'
+        try:
+            with open(self.path, 'r+b') as f:
+                if _stat_signature(os.fstat(f.fileno())) != self.stat_signature:
+                    mode = None
+                else:
+                    mode = self._patch(f, fsync)
+                if mode in ('appended', 'patched'):
+                    f.flush()
+                    if fsync:
+                        os.fsync(f.fileno())
+                    self.stat_signature = _stat_signature(os.fstat(f.fileno()))
+        except FileNotFoundError:
+            mode = None
+        except BaseException:
+            self._offsets = None  ## May be ahead of the file
+            raise
+        if mode is None:  ## Changed on disk, the content replaces it
+            self.out(self.path, self.separator_char, self.comment_char, is_absolute=True, atomic=True, fsync=fsync)
+            self._offsets = None
+            mode = 'rewritten'
+        if mode == 'rewritten':
+            self.stat_signature = _stat_signature(os.stat(self.path))
+        self.content_hash = None
+        self._dirty = None
+        return mode
+
+    def _patch(self, f, fsync: bool) -> str:
+        """Applies the dirty keys to the open file
+        :return: 'appended', 'patched' or 'rewritten'
+        """
+        if self._offsets is None:
+            f.seek(0)
+            self._offsets = _scan_offsets(f, self.separator_char.encode(), self.comment_char.encode())
+        entries = self._offsets
+        edits, appended = [], []
+        for key in self._dirty:
+            line = self._entryLine(key)
+            if key in entries.index:
+                *others, entry = entries.entries(key)
+                edits.extend((*entries.range(other), other, b'') for other in others)  ## Earlier duplicates
+                edits.append((*entries.range(entry), entry, line))
+                entries.duplicates.discard(key)
+                if not line:
+                    del entries.index[key]
+            elif line:
+                appended.append((key, line))
+        last = entries.last()
+        if entries.open_end:  ## The last value continues on the next line, appended keys would join it
+            if appended and all(edit[2] != last for edit in edits):
+                edits.append((*entries.range(last), last, self._entryLine(entries.keys[last])))
+            entries.open_end = all(edit[2] != last for edit in edits)
+        size = f.seek(0, os.SEEK_END)
+        edits.sort()
+        first = edits[0][0] if edits else size
+        f.seek(max(first - 1, 0))
+        tail = f.read()
+        before, tail = (tail[:1], tail[1:]) if first else (b'', tail)
+        chunks, pos = [], first
+        for start, end, entry, line in edits:
+            chunks.append(tail[pos - first:start - first])
+            chunks.append(line)
+            entries.resize(entry, len(line))
+            pos = end
+        chunks.append(tail[pos - first:])
+        new_size = first + sum(map(len, chunks))
+        if appended:
+            end_byte = next((chunk[-1:] for chunk in reversed(chunks) if chunk), before)
+            if end_byte not in (b'', b'\n'):
+                chunks.append(b'\n')
+                last = entries.last()
+                if last is not None and entries.range(last)[1] == new_size:  ## It now ends with the newline
+                    entries.resize(last, entries.sizes[last] + 1)
+                new_size += 1
+            for key, line in sorted(appended):
+                chunks.append(line)
+                entries.add(key, new_size, len(line))
+                new_size += len(line)
+        if size - first > size // 2:  ## Cheaper to write a new file than to move most of this one
+            f.seek(0)
+            _write_file(self.path, f.read(first) + b''.join(chunks), atomic=True, fsync=fsync)
+            return 'rewritten'
+        f.seek(first)
+        f.write(b''.join(chunks))
+        f.truncate()
+        return 'patched' if edits else 'appended'
+
+    def _entryLine(self, key: str) -> bytes:
+        """:return: line of key in the file, empty if it was removed"""
+        if key not in self.content:
+            return b''
+        return (key + self.separator_char + self.content[key] + '\n').encode()
+
+    async def aload(self, path: str, separator_char: str = '=', comment_char: str = '#', is_absolute: bool = False,
+                    hash_content: bool = False, executor=None) -> 'Properties':
+        """Same as load, reading and parsing the file in an executor instead of the event loop
+        :param executor: concurrent.futures executor, None uses the event loop's default one
+        """
+        import asyncio  ## Imported on use, it is slower to import than this module
+        return await asyncio.get_running_loop().run_in_executor(executor, functools.partial(
+            self.load, path, separator_char, comment_char, is_absolute, hash_content))
+
+    async def aout(self, path: str = None, separator_char: str = '=', comment_char: str = '#', comments=None,
+                   comments_pos: str = 'top', is_absolute: bool = False, atomic: bool = False, fsync: bool = True,
+                   executor=None):
+        """Same as out, writing the file in an executor instead of the event loop
+        :param executor: concurrent.futures executor, None uses the event loop's default one
+        """
+        import asyncio
+        return await asyncio.get_running_loop().run_in_executor(executor, functools.partial(
+            self.out, path, separator_char, comment_char, comments, comments_pos, is_absolute, atomic, fsync))
+
+
+class LazyProperties(Properties):
+    on_load: Optional[Callable[['LazyProperties'], None]]  ## Called after the content was parsed on first use
+    modified: bool  ## Set by setProperty, replaceProperty and removeProperty, the content is then never unloaded
+    __slots__ = ('on_load', 'modified')
+
+    def __init__(self, path: str, **kwargs):
+        """ Creates a Properties object which only parses its file when its content is first used,
+        unload() drops the content which is then parsed again on next use
+        :param path: string path as relative {used with a context manager}
+        :key separator_char: properties file separator character (default:=)
+        :key comment_char: properties file comment character (default:#)
+        :key is_absolute: boolean of whether or not the path given is absolute
+        """
+        super().__init__(**kwargs)
+        if not kwargs.get('is_absolute', False):
+            path = str(os.getcwd()) + self.platformSeparator + clean_path(path)
+        self.path = clean_path(path)
+        self.on_load = None
+        self.modified = False
+        try:
+            self.stat_signature = _stat_signature(os.stat(self.path))
+        except FileNotFoundError:
+            logger.warning("File not found: '%s'", self.path)
+        self.unload()
+
+    def __getattr__(self, name):
+        ## Only called when content or comments are missing, meaning the file isn't parsed yet
+        if name not in ('content', 'comments'):
+            raise AttributeError(f"'{self.__class__.__name__}' object has no attribute '{name}'")
+        self.load(self.path, self.separator_char, self.comment_char, is_absolute=True,
+                  hash_content=self.content_hash is not None)
+        try:
+            value = getattr(Properties, name).__get__(self)
+        except AttributeError:
+            if os.path.exists(self.path):  ## Unloaded again by another thread in the meantime
+                return self.__getattr__(name)
+            self.content, self.comments = {}, {}  ## File not found
+            self._changed()
+            value = getattr(Properties, name).__get__(self)
+        if self.on_load is not None:
+            self.on_load(self)
+        return value
+
+    def __repr__(self):
+        return f"<{self.__class__}, loaded_file: '{self.path if self.path else 'None'}', loaded={self.isLoaded()}>"
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state[1]['on_load'] = None  ## Copies and pickles don't carry the handler along
+        return state
+
+    def isLoaded(self) -> bool:
+        """Used to know if the file content is currently parsed"""
+        try:
+            Properties.content.__get__(self)
+        except AttributeError:
+            return False
+        return True
+
+    def unload(self) -> bool:
+        """Drops the parsed content, it will be parsed again when next used
+        :return: False if the content was modified in memory and was kept
+        """
+        if self.modified:
+            return False
+        self._typed = self._key_index = None  ## The file may have changed by the time it is parsed again
+        for slot in (Properties.content, Properties.comments):
+            try:
+                slot.__delete__(self)
+            except AttributeError:
+                pass
+        return True
+
+    def load(self, *args, **kwargs) -> 'LazyProperties':
+        self.modified = False
+        return super().load(*args, **kwargs)
+
+    def reload(self, only_if_modified: bool = False, check_hash: bool = False) -> bool:
+        """Reloads the property file, if it isn't parsed only its stat signature (and hash with check_hash) is updated
+        :return: True if the file was reloaded (or changed while not parsed), False if it didn't change or was removed
+        """
+        if self.isLoaded():
+            return super().reload(only_if_modified, check_hash)
+        changed = self.isModified(check_hash)
+        try:
+            self.stat_signature = _stat_signature(os.stat(self.path))
+            if check_hash:  ## Compared by the next reload, and kept up to date when the file is parsed
+                self.content_hash = _file_hash(self.path)
+        except FileNotFoundError:  ## Its content will be empty when parsed
+            if self.stat_signature is not None:
+                self._changed()
+            self.stat_signature = self.content_hash = None
+            return False
+        if changed:
+            self._changed()  ## Caches and listeners built from the previous content
+        return changed or not only_if_modified
+
+    def replaceProperty(self, key: str, val: str, create_if_needed: bool = False):
+        super().replaceProperty(key, val, create_if_needed)
+        self.modified = True
+
+    def writeBack(self, fsync: bool = True) -> str:
+        mode = super().writeBack(fsync)
+        if not self._dirty:  ## The file now matches the content, which can be unloaded again
+            self.modified = False
+        return mode
+
+    def setProperty(self, key: str, val: any):
+        super().setProperty(key, val)
+        self.modified = True
+
+    def removeProperty(self, key: str) -> str:
+        self.modified = True
+        return super().removeProperty(key)
+
+
+class _MappedItemsView(ItemsView):
+    def __iter__(self):
+        prop = self._mapping.prop
+        return ((prop._key(entry), prop._value(entry)) for entry in range(len(prop._hashes)))
+
+
+class _MappedValuesView(ValuesView):
+    def __iter__(self):
+        prop = self._mapping.prop
+        return (prop._value(entry) for entry in range(len(prop._hashes)))
+
+
+class _MappedContent(Mapping):
+    """Read-only mapping over the offset index of a MappedProperties object, values are decoded when accessed"""
+
+    def __init__(self, prop: 'MappedProperties'):
+        self.prop = prop
+
+    def __getitem__(self, key: str) -> str:
+        entry = self.prop._find(key) if isinstance(key, str) else -1
+        if entry < 0:
+            raise KeyError(key)
+        return self.prop._value(entry)
+
+    def __contains__(self, key) -> bool:
+        return isinstance(key, str) and self.prop._find(key) >= 0
+
+    def __iter__(self):
+        return (self.prop._key(entry) for entry in range(len(self.prop._hashes)))
+
+    def __len__(self) -> int:
+        return len(self.prop._hashes)
+
+    def items(self) -> ItemsView:
+        return _MappedItemsView(self)
+
+    def values(self) -> ValuesView:
+        return _MappedValuesView(self)
+
+
+class MappedProperties(Properties):
+    _mm: Optional[mmap.mmap]
+    _hashes: array  ## hash of each key, entries are in file order
+    _key_starts: array  ## Byte range of each key in the file
+    _key_ends: array
+    _value_starts: array  ## Byte range of each value, up to the end of its last line if it is multi-line
+    _value_ends: array
+    _slots: array  ## Open addressing hash table of entry indexes, -1 for empty slots
+    __slots__ = ('_mm', '_hashes', '_key_starts', '_key_ends', '_value_starts', '_value_ends', '_slots')
+
+    def __init__(self, path: str = False, **kwargs):
+        """ Creates a read-only Properties object for very large files: the file is memory-mapped and only an index of
+        byte offsets is kept in memory, values are decoded when accessed and getContent, getKeySet and getValuesSet
+        are lazy views. The file must be replaced (not rewritten in place) while it is mapped
+        :param path: string path as relative {used with a context manager}
+        :key separator_char: properties file separator character (default:=)
+        :key comment_char: properties file comment character (default:#)
+        :key is_absolute: boolean of whether or not the path given is absolute
+        """
+        self._mm = None
+        self._clearIndex()
+        super().__init__(path, **kwargs)
+
+    def _clearIndex(self):
+        self._hashes, self._key_starts, self._key_ends = array('q'), array('q'), array('q')
+        self._value_starts, self._value_ends = array('q'), array('q')
+        self._slots = array('q', [-1]) * 8
+
+    def load(self, path: str, separator_char: str = '=', comment_char: str = '#',
+             is_absolute: bool = False, hash_content: bool = False) -> 'MappedProperties':
+        """ Maps the file and indexes its keys, see Properties.load (hash_content is not supported and ignored)"""
+        logger.debug('Loading file: %s', path)
+        start = time.perf_counter()
+        if not is_absolute:
+            path = str(os.getcwd()) + self.platformSeparator + clean_path(path)
+        path = clean_path(path)
+        try:
+            with open(path, 'rb') as f:
+                st = os.fstat(f.fileno())
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if st.st_size else None
+        except FileNotFoundError:
+            logger.warning("File not found: '%s'", path)
+            return self
+        self._closeMap()
+        self._clearIndex()
+        self._mm = mm
+        self.comments = self._index(path, separator_char.encode(), comment_char.encode()) if mm is not None else {}
+        self.content = _MappedContent(self)
+        self._changed()
+        self.stat_signature = _stat_signature(st)
+        self.content_hash = None
+        self.path = path
+        self.separator_char = separator_char
+        self.comment_char = comment_char
+        _emitLoaded(self, start)
+        return self
+
+    def _index(self, path: str, separator: bytes, comment: bytes) -> dict:
+        """Builds the offset index of the mapped file, follows the same rules as _parse_lines
+        :return: comments dict, keyed by line number
+        """
+        mm = self._mm
+        size = len(mm)
+        comments = {}
+        continued_entry = -1  ## Entry whose value continues on the next line
+        pos, index = 0, -1
+        while pos < size:
+            index += 1
+            end = mm.find(b'\n', pos)
+            if end < 0:
+                end = size
+            line = mm[pos:end]
+            stripped = line.strip()
+            line_start = pos + len(line) - len(line.lstrip())
+            pos = end + 1
+            if not stripped:
+                continue
+            line_end = line_start + len(stripped)
+            if continued_entry >= 0:
+                entry = continued_entry
+                self._value_ends[entry] = line_end
+            elif not stripped.startswith(comment):
+                if stripped.count(separator) != 1:
+                    raise ValueError(f"Line {index + 1} of '{path}' must contain exactly one '{separator.decode()}'")
+                key_end = line_start + stripped.index(separator)
+                entry = self._insert(mm[line_start:key_end].decode(), line_start, key_end)
+                self._value_starts[entry] = key_end + len(separator)
+                self._value_ends[entry] = line_end
+            else:
+                comments[index] = stripped[len(comment):].decode().strip()
+                continue
+            continued_entry = entry if stripped.endswith(b'\\') else -1
+        return comments
+
+    def _insert(self, key: str, key_start: int, key_end: int) -> int:
+        """Adds a key to the index, or finds it if it is repeated in the file
+        :return: its entry index
+        """
+        entry = self._find(key)
+        if entry >= 0:
+            return entry
+        entry = len(self._hashes)
+        self._hashes.append(hash(key))
+        self._key_starts.append(key_start)
+        self._key_ends.append(key_end)
+        self._value_starts.append(0)
+        self._value_ends.append(0)
+        if 2 * len(self._hashes) > len(self._slots):
+            self._slots = array('q', [-1]) * (4 * len(self._slots))
+            for other in range(entry + 1):
+                self._place(other)
+        else:
+            self._place(entry)
+        return entry
+
+    def _place(self, entry: int):
+        mask = len(self._slots) - 1
+        slot = self._hashes[entry] & mask
+        while self._slots[slot] >= 0:
+            slot = (slot + 1) & mask
+        self._slots[slot] = entry
+
+    def _find(self, key: str) -> int:
+        """:return: entry index of key, -1 if it isn't in the file"""
+        key_hash = hash(key)
+        mask = len(self._slots) - 1
+        slot = key_hash & mask
+        while True:
+            entry = self._slots[slot]
+            if entry < 0:
+                return -1
+            if self._hashes[entry] == key_hash and self._key(entry) == key:
+                return entry
+            slot = (slot + 1) & mask
+
+    def _key(self, entry: int) -> str:
+        return self._mm[self._key_starts[entry]:self._key_ends[entry]].decode()
+
+    def _value(self, entry: int) -> str:
+        raw = self._mm[self._value_starts[entry]:self._value_ends[entry]].decode()
+        if '\n' not in raw:
+            return raw.replace('\\', '') if raw.endswith('\\') else raw
+        lines = raw.split('\n')
+        first = lines[0].rstrip()  ## Strips the '\r' of CRLF files, like the stripped lines of _parse_lines
+        parts = [first.replace('\\', '') if first.endswith('\\') else first]
+        for line in lines[1:]:
+            line = line.strip()
+            if line:
+                parts.append(line.replace('\\', '') if line[-1] == '\\' else line)
+        return ' '.join(parts)
+
+    def _closeMap(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+    def clear(self):
+        """Clears the content stored, the path of the file and unmaps it"""
+        super().clear()
+        self._closeMap()
+        self._clearIndex()
+
+    def clone(self) -> 'MappedProperties':
+        """Used to clone the <MappedProperties> object, the file is mapped again
+        :return: copy of self
+        """
+        if not self.path:
+            return MappedProperties(separator_char=self.separator_char, comment_char=self.comment_char)
+        return MappedProperties(self.path, separator_char=self.separator_char, comment_char=self.comment_char,
+                                is_absolute=True)
+
+    def _readOnly(self, *args):
+        raise TypeError(f"{self.__class__.__name__} objects are read-only")
+
+    replaceProperty = setProperty = removeProperty = _readOnly
+
+
+class LayeredProperties:
+    layers: list[Properties]  ## Highest priority first
+    _merged: dict  ## Key -> value of the first layer containing it
+    _versions: tuple  ## Versions of the layers when _merged was built
+    _seen_version: int  ## Last changed version when the layers were last checked
+
+    def __init__(self, layers: list[Properties]):
+        """ Read-only view resolving keys through an ordered list of Properties objects, the first layer containing a
+        key gives its value (for example tenant, then environment, then defaults).
+        The layers are merged into a single dict, which is built again only after a layer was loaded again or changed
+        through its methods, changes made directly to a layer's content dict need a call to refresh()
+        :param layers: list of Properties objects, highest priority first
+        """
+        self.layers = list(layers)
+        self.refresh()
+
+    def __repr__(self):
+        return f"<{self.__class__}, layers: {[layer.getPath() or 'None' for layer in self.layers]}>"
+
+    def refresh(self):
+        """Builds the merged content again"""
+        self._seen_version = _last_version[0]
+        merged = {}
+        for layer in reversed(self.layers):
+            merged.update(layer.content)  ## May parse a lazy layer, so versions are read after
+        self._versions = tuple(layer._version for layer in self.layers)
+        self._merged = merged
+
+    def _content(self) -> dict:
+        if self._seen_version != _last_version[0]:  ## Some Properties object changed, maybe one of the layers
+            if tuple(layer._version for layer in self.layers) != self._versions:
+                self.refresh()
+            else:
+                self._seen_version = _last_version[0]
+        return self._merged
+
+    def getLayers(self) -> list[Properties]:
+        """:return: the layers, highest priority first"""
+        return self.layers
+
+    def getProperty(self, key: str) -> str:
+        """Returns the value of key from the first layer containing it
+        :param key: str, key to resolve
+        :return: value of key, Undefined if no layer contains it
+        """
+        return self._content().get(key, 'Undefined')
+
+    def getMany(self, keys) -> dict[str, str]:
+        """Resolves several keys at once
+        :param keys: iterable of keys
+        :return: dict of key -> value, Undefined for keys no layer contains
+        """
+        content = self._content()
+        return {key: content.get(key, 'Undefined') for key in keys}
+
+    def containsProperty(self, key: str) -> bool:
+        """:return: boolean, True if a layer contains the key"""
+        return key in self._content()
+
+    def getContent(self) -> dict:
+        """Returns the merged content, it must not be modified
+        :return: dict, key -> resolved value
+        """
+        return self._content()
+
+    def getKeySet(self) -> KeysView:
+        """
+        :return: Set of Keys of all the layers
+        """
+        return self._content().keys()
+
+    def getValuesSet(self) -> ValuesView:
+        """
+        :return: Resolved values
+        """
+        return self._content().values()
+
+
+_REFERENCE = re.compile(r'\$\{([^${}]+)\}')
+
+
+def _compileValue(value: str) -> tuple:
+    """Splits a value into literal str segments and (name or None, key, reference text) references,
+    ${key} references a key of the same Properties object and ${name:key} one of the object named name in a handler
+    """
+    if '${' not in value:
+        return (value,)
+    segments = []
+    pos = 0
+    for match in _REFERENCE.finditer(value):
+        if match.start() > pos:
+            segments.append(value[pos:match.start()])
+        name, _, key = match.group(1).rpartition(':') if ':' in match.group(1) else (None, '', match.group(1))
+        segments.append((name, key, match.group(0)))
+        pos = match.end()
+    if pos < len(value):
+        segments.append(value[pos:])
+    return tuple(segments)
+
+
+class _WeakListener:
+    """Properties listener calling a method through a weak reference, so that it doesn't keep its object alive,
+    it removes itself from the listeners of the Properties objects it is called by once the object is gone"""
+    __slots__ = ('method',)
+
+    def __init__(self, method):
+        self.method = weakref.WeakMethod(method)
+
+    def __call__(self, prop: Properties, key: Optional[str]):
+        method = self.method()
+        if method is not None:
+            method(prop, key)
+        elif prop._listeners and self in prop._listeners:
+            prop._listeners.remove(self)
+
+
+class Interpolator:
+    source: 'Properties | PropertiesHandler'
+    _listener: _WeakListener  ## Registered on the cached Properties objects, calls _onChange
+    _compiled: dict[tuple, tuple]  ## (Properties, key) -> parts of its value, see _parts
+    _resolved: dict[tuple, str]  ## (Properties, key) -> resolved value
+    _dependents: dict[tuple, set]  ## (Properties, key) -> nodes whose resolved value used it
+    _nodes: dict[Properties, set]  ## Keys cached for each Properties object
+    _names_version: int  ## Of the handler, when the caches were last checked
+
+    def __init__(self, source):
+        """ Expands ${key} references in the values of a Properties object, or ${key} and ${name:key} references (name
+        of another Properties object) in the values of the Properties objects of a PropertiesHandler. References to
+        unknown keys are kept as they are.
+        Values are compiled into segments once and resolved values are cached along with a graph of the references,
+        so that a change of a key (through the Properties methods) or a reload only resolves its dependents again
+        :param source: Properties or PropertiesHandler object
+        """
+        self.source = source
+        self._compiled, self._resolved, self._dependents, self._nodes = {}, {}, {}, {}
+        self._names_version = getattr(source, '_names_version', 0)
+        self._listener = _WeakListener(self._onChange)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}, source={self.source!r}, cached={len(self._resolved)}>"
+
+    def _prop(self, name: str = None) -> Optional[Properties]:
+        if isinstance(self.source, Properties):
+            return self.source
+        self._checkNames()
+        return self.source.get() if name is None else self.source.properties_dict.get(name)
+
+    def _checkNames(self):
+        if self.source._names_version != self._names_version:  ## Names may refer to other objects now
+            self.clearCache()
+            self._names_version = self.source._names_version
+
+    def get(self, key: str, name: str = None, default: str = 'Undefined') -> str:
+        """Returns the value of key with its references expanded
+        :param key: str, key of dict
+        :param name: name of the Properties object in the handler, defaults to the current one (ignored if the source
+        is a Properties object)
+        :param default: returned if the key is not found
+        :return: the resolved value, raises a ValueError if it references itself through other keys
+        """
+        prop = self._prop(name)
+        if prop is None or key not in prop.content:
+            return default
+        return self._resolve((prop, key))
+
+    def getMany(self, keys, name: str = None) -> dict[str, str]:
+        """Resolves several keys at once, see get
+        :return: dict of key -> resolved value, Undefined for keys not found
+        """
+        return {key: self.get(key, name) for key in keys}
+
+    def resolveAll(self, name: str = None) -> dict[str, str]:
+        """:return: the content of a Properties object (see get for name) with every value resolved"""
+        prop = self._prop(name)
+        if prop is None:
+            return {}
+        return {key: self._resolve((prop, key)) for key in list(prop.content)}
+
+    def findCycles(self) -> list[list[str]]:
+        """Checks every value of the source for reference cycles
+        :return: list of cycles, each a list of 'name:key' (or 'key' for a Properties source) ending with its start
+        """
+        if isinstance(self.source, Properties):
+            props = [self.source]
+        else:
+            self._checkNames()
+            props = list(self.source.properties_dict.values())
+        cycles = []
+        done = set()
+        for prop in props:
+            for key in list(prop.content):
+                if (prop, key) in done:
+                    continue
+                stack, on_stack = [((prop, key), iter(self._references((prop, key))))], {(prop, key)}
+                while stack:
+                    node, references = stack[-1]
+                    for dependency in references:
+                        if dependency in on_stack:
+                            path = [other for other, _ in stack]
+                            cycles.append([self._label(other) for other in path[path.index(dependency):]]
+                                          + [self._label(dependency)])
+                        elif dependency not in done:
+                            stack.append((dependency, iter(self._references(dependency))))
+                            on_stack.add(dependency)
+                            break
+                    else:
+                        stack.pop()
+                        on_stack.discard(node)
+                        done.add(node)
+        return cycles
+
+    def clearCache(self):
+        """Drops every compiled and resolved value, needed after changing a content dict directly"""
+        for prop in self._nodes:
+            if prop._listeners and self._listener in prop._listeners:
+                prop._listeners.remove(self._listener)
+        self._compiled, self._resolved, self._dependents, self._nodes = {}, {}, {}, {}
+
+    close = clearCache
+
+    def _label(self, node: tuple) -> str:
+        prop, key = node
+        if isinstance(self.source, Properties):
+            return key
+        return f'{self.source.getName(prop) or prop.getPath()}:{key}'
+
+    def _watch(self, prop: Properties) -> set:
+        """:return: the cached keys of prop, after registering the listener of self on it"""
+        keys = self._nodes.get(prop)
+        if keys is None:
+            keys = self._nodes[prop] = set()
+            if prop._listeners is None:
+                prop._listeners = []
+            prop._listeners.append(self._listener)
+        return keys
+
+    def _parts(self, node: tuple) -> tuple:
+        """:return: the compiled value of node, literal str parts and (referenced node, reference text) parts"""
+        parts = self._compiled.get(node)
+        if parts is None:
+            prop, key = node
+            self._watch(prop).add(key)
+            parts = []
+            for segment in _compileValue(prop.content.get(key, '')):
+                if isinstance(segment, str):
+                    parts.append(segment)
+                    continue
+                target = self._target(prop, segment)
+                parts.append((target, segment[2]))
+                if target[0] is not prop:
+                    self._watch(target[0])
+                self._dependents.setdefault(target, set()).add(node)  ## Also when missing, for when it is set
+            parts = self._compiled[node] = tuple(parts)
+        return parts
+
+    def _target(self, prop: Properties, segment: tuple) -> tuple:
+        """:return: node referenced by a segment"""
+        name, key, text = segment
+        if name is None:
+            return prop, key
+        other = self._prop(name) if not isinstance(self.source, Properties) else None
+        if other is None:  ## Not a name, the whole reference is a key of prop
+            return prop, text[2:-1]
+        return other, key
+
+    def _references(self, node: tuple) -> list[tuple]:
+        """:return: nodes referenced by the value of node which exist"""
+        return [part[0] for part in self._parts(node) if not isinstance(part, str) and part[0][1] in part[0][0].content]
+
+    def _resolve(self, root: tuple) -> str:
+        resolved = self._resolved
+        value = resolved.get(root)
+        if value is not None:
+            return value
+        stack, on_stack = [root], {root}
+        while stack:  ## Depth first, without recursion so that long reference chains don't hit the recursion limit
+            node = stack[-1]
+            parts = self._parts(node)
+            pending = None
+            for part in parts:
+                if not isinstance(part, str) and part[0] not in resolved and part[0][1] in part[0][0].content:
+                    pending = part[0]
+                    break
+            if pending is not None:
+                if pending in on_stack:
+                    cycle = stack[stack.index(pending):] + [pending]
+                    raise ValueError('Reference cycle: ' + ' -> '.join(self._label(other) for other in cycle))
+                stack.append(pending)
+                on_stack.add(pending)
+                continue
+            if len(parts) == 1 and isinstance(parts[0], str):
+                value = parts[0]
+            else:
+                value = ''.join(part if isinstance(part, str) else resolved.get(part[0], part[1]) for part in parts)
+            resolved[node] = value
+            stack.pop()
+            on_stack.discard(node)
+        return value
+
+    def _onChange(self, prop: Properties, key: Optional[str]):
+        """Listener of the cached Properties objects, drops the changed nodes and their dependents"""
+        keys = self._nodes.get(prop, ()) if key is None else (key,)
+        nodes = [(prop, key) for key in list(keys)]
+        if key is None:
+            ## Missing keys referenced by other objects are only known as dependencies
+            nodes.extend(node for node in list(self._dependents) if node[0] is prop)
+        while nodes:
+            node = nodes.pop()
+            self._compiled.pop(node, None)
+            self._resolved.pop(node, None)
+            nodes.extend(self._dependents.pop(node, ()))
+
+
+_NO_LOCK = contextlib.nullcontext()  ## Lock of handlers which are not thread safe
+
+
+def _locked(method):
+    """Runs a PropertiesHandler method holding the handler's lock"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _loadProperties(file: tuple[str, dict]) -> Properties:
+    path, kwargs = file
+    return Properties(path, **kwargs)
+
+
+def _loadFiles(files: list[tuple[str, dict]], workers: int = 0, use_processes: bool = False) -> list[Properties]:
+    """Creates a Properties object for each (path, Properties kwargs) pair, results keep the order of files
+    :param workers: number of files loaded in parallel, 0 loads them one by one
+    :param use_processes: if True uses a process pool instead of a thread pool
+    """
+    if not workers or len(files) < 2:
+        return [_loadProperties(file) for file in files]
+    if use_processes:
+        with ProcessPoolExecutor(workers) as executor:
+            return list(executor.map(_loadProperties, files, chunksize=max(1, len(files) // (workers * 4))))
+    with ThreadPoolExecutor(workers) as executor:
+        return list(executor.map(_loadProperties, files))
+
+
+async def _aloadFiles(factories: list, concurrency: int = 8, executor=None) -> list:
+    """Calls each function of factories in an executor, at most concurrency of them at a time
+    :return: their results, in the order of factories
+    """
+    import asyncio
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(factory):
+        async with semaphore:
+            return await loop.run_in_executor(executor, factory)
+    return list(await asyncio.gather(*(run(factory) for factory in factories)))
+
+
+def _loadSnapshot(snapshot: str, paths: list[str], workers: int = 0, use_processes: bool = False) -> list[Properties]:
+    """Creates a Properties object for each absolute path, restoring unchanged files from the snapshot file,
+    the snapshot is rewritten if any file had to be parsed
+    :param workers: number of files parsed in parallel, 0 parses them one by one
+    :param use_processes: if True uses a process pool instead of a thread pool
+    """
+    entries = _readCache(snapshot)
+    props: list[Optional[Properties]] = [None] * len(paths)
+    missing = []
+    for index, path in enumerate(paths):
+        entry = entries.get(path)
+        try:
+            unchanged = entry is not None and entry[0] == _stat_signature(os.stat(path))
+        except FileNotFoundError:
+            unchanged = False
+        if unchanged:
+            props[index] = Properties(separator_char=entry[1], comment_char=entry[2])
+            props[index]._restore(path, entry)
+        else:
+            missing.append(index)
+    for index, prop in zip(missing, _loadFiles([(paths[index], {'is_absolute': True}) for index in missing],
+                                               workers, use_processes)):
+        props[index] = prop
+    if missing or len(entries) != len(paths):
+        _writeCache(snapshot, {prop.getPath(): prop._cacheEntry() for prop in props if prop.getPath()})
+    return props
+
+
+def _dropIndexed(index: dict, key, name: str):
+    """Removes a name from the list of names of key in a PropertiesHandler index"""
+    names = index.get(key)
+    if names is not None and name in names:
+        names.remove(name)
+        if not names:
+            del index[key]
+
 
 class PropertiesHandler:
     properties_dict: dict[str, Properties]
     curr_prop: Optional[Properties]
     directories_dict: dict[str, list[str]]
+    _directory_files: dict[str, set[str]]  ## Same paths as directories_dict, for membership tests
     directories_name_dict: dict[str, str]
-    platformSeparator: str
-
-    def __init__(self, properties_list=None):
+    _watcher: Optional['DirectoryWatcher']  ## Started by watch(), see watcher.py
+    _lock: contextlib.AbstractContextManager  ## Held by methods changing the handler, a no-op unless thread_safe
+    _names_version: int  ## Changed whenever a name is bound to another Properties object or removed
+    _path_index: dict[str, list[str]]  ## Absolute path -> names in properties_dict, in the order they were added
+    _path_listeners: dict[str, tuple[Properties, Callable, str]]  ## Name -> (object, listener moving it in _path_index
+    ## when it loads another file, path it is indexed under or '')
+    _name_index: dict[int, list[str]]  ## id of a Properties object -> names in properties_dict
+    _next_num: int  ## Next never used number for automatic 'prop' names
+    _free_nums: list[int]  ## Heap of numbers released by removed 'prop' names
+    _order: list[str]  ## Names in properties_dict order, used to access them by index
+    _curr_index: int  ## Index of curr_prop in _order, -1 if unknown
+    _lazy_loaded: OrderedDict[int, LazyProperties]  ## Parsed LazyProperties objects, least recently used first
+    _lazy_directories: set[str]
+    _key_names: Optional[dict[str, set[str]]]  ## Key -> names of the Properties objects defining it, see key_index
+    _name_keys: dict[str, list[str]]  ## Name -> its keys in _key_names (maybe more), to find the ones a reload removed
+    _key_listeners: dict[str, tuple[Properties, Callable]]  ## Name -> (object, listener keeping _key_names up to date)
+    name_by_stem: bool
+    max_loaded: int
+
+    def __init__(self, properties_list=None, name_by_stem: bool = False, max_loaded: int = 0,
+                 thread_safe: bool = False, key_index: bool = False):
         """Creates a 'PropertiesHandler' object used to manage and switch easily between Properties objects,
         useful for supporting languages for example
         :param properties_list: A list of Properties objects if you have one
+        :param name_by_stem: if True Properties objects added without a name are named after their file name
+        (without extension), falls back to prop+a_number if that name is already used
+        :param max_loaded: maximum number of parsed LazyProperties (from lazy directories), the least recently used
+        ones are unloaded and parsed again when needed. 0 means no limit
+        :param thread_safe: if True methods changing the handler (adding, removing, switching, loading directories...)
+        hold a lock so that several threads can change it, reading methods don't take it (except the key_index ones).
+        Properties objects are always loaded into a new dict which then replaces their content, so readers see either
+        the old or the new content
+        :param key_index: if True keeps the names of the Properties objects defining each key, up to date when objects
+        are added, removed, reloaded or changed through their methods, for getNamesWithKey, getNamesWithoutKey and
+        getMissingKeys (which otherwise check every object). Files of lazy directories are then parsed when added
         """
+        self._lock = threading.RLock() if thread_safe else _NO_LOCK
+        self._names_version = 0
+        self._key_names = {} if key_index else None
+        self._key_listeners = {}
+        self._path_listeners = {}
         if properties_list is None:
             properties_list = []
-        self.properties_dict = {}
         self.directories_dict = {}
+        self._directory_files = {}
         self.directories_name_dict = {}
-        self.curr_prop = None
-        self.platformSeparator = getPlatformSeparators()
+        self._lazy_directories = set()
+        self._watcher = None
+        self.name_by_stem = name_by_stem
+        self.max_loaded = max_loaded
+        self._clearProperties()
         if properties_list:
             for prop in properties_list:
                 if not isinstance(prop, Properties):
@@ -288,54 +1877,68 @@ class PropertiesHandler:
                     continue
                 self.addProperty(prop)
 
+    @property
+    def platformSeparator(self) -> str:
+        return getPlatformSeparators()
+
     def __repr__(self):
         return f"<{self.__class__.__name__} class, number_of_childs={len(self.properties_dict)}, " \
                f"selected_properties_class={self.curr_prop if self.curr_prop else 'None'}, " \
                f"list_of_childs={self.properties_dict}>"
 
-    def passFiles(self, files_list: list, input_order: str = 's,c') -> 'PropertiesHandler':
+    @_locked
+    def passFiles(self, files_list: list, input_order: str = 's,c', workers: int = 0,
+                  use_processes: bool = False) -> 'PropertiesHandler':
         """Used when creating the object or to pass multiple files at once;
         Multiple lists are valid, you can do a list with only paths or replace some paths wit a lsit containing the path,
         followed by the separator character then followed by the comment character. (According to the input order,
         defaults to separator then comment, can be changed by setting 'input_order' to 'c,s'.
         :param files_list: a list of .properties files path. Can be used as [[path, separator_char, comment_char], [path, separator_char]]
         :param input_order: defines the input order in sublists, separator character first or second (default=s,c)
+        :param workers: number of files loaded in parallel, 0 loads them one by one
+        :param use_processes: if True uses a process pool instead of a thread pool (for large files, parsing bound)
         :return: self so that it can be used to instantiate
         """
+        files = []
         for file in files_list:
             if isinstance(file, list):
                 length = len(file)
                 if length == 1:
-                    self.addProperty(Properties(file[0]))
+                    files.append((file[0], {}))
                 elif length == 2:
                     if input_order == 'c,s':
-                        self.addProperty(Properties(file[0], comment_char=file[1]))
+                        files.append((file[0], {'comment_char': file[1]}))
                     else:
-                        self.addProperty(Properties(file[0], separator_char=file[1]))
+                        files.append((file[0], {'separator_char': file[1]}))
                 elif length == 3:
                     if input_order == 'c,s':
-                        self.addProperty(Properties(file[0], comment_char=file[1], separator_char=file[2]))
+                        files.append((file[0], {'comment_char': file[1], 'separator_char': file[2]}))
                     else:
-                        self.addProperty(Properties(file[0], separator_char=file[1], comment_char=file[2]))
+                        files.append((file[0], {'separator_char': file[1], 'comment_char': file[2]}))
                 else:
                     print(f'Invalid input file={file}')
 
             else:
-                try:
-                    self.addProperty(Properties(file))
-                except FileNotFoundError:
-                    print(f"File '{file}' not found")
-                    continue
+                files.append((file, {}))
+        for prop in _loadFiles(files, workers, use_processes):
+            self.addProperty(prop)
         return self
 
     def getDirectorys(self):
         return self.directories_dict
 
-    def setDirectory(self, relative_path: str, is_absolute: bool = False):
+    @_locked
+    def setDirectory(self, relative_path: str, is_absolute: bool = False, workers: int = 0,
+                     use_processes: bool = False, lazy: bool = False, snapshot: str = None):
         """Used to set a single directory as the container for all .properties files,
          removes every other Properties objects stored
         :param relative_path: relative path to directory or absolute if is_absolute is True
         :param is_absolute: boolean of whether or not the path given is absolute
+        :param workers: number of files loaded in parallel, 0 loads them one by one
+        :param use_processes: if True uses a process pool instead of a thread pool (for large files, parsing bound)
+        :param lazy: if True files are only parsed when first used (see LazyProperties), workers are then ignored
+        :param snapshot: path of a file caching the whole parsed directory, unchanged files are read from it instead of
+        being parsed and it is rewritten when files changed (ignored if lazy)
         """
         if not is_absolute:
             absolute_path = str(os.getcwd()) + self.platformSeparator + clean_path(relative_path)
@@ -345,20 +1948,55 @@ class PropertiesHandler:
         if not absolute_path.endswith(self.platformSeparator):
             absolute_path += self.platformSeparator
         self.directories_dict = {absolute_path: []}
-        self.properties_dict = {}
-        self.curr_prop = None
-        for file in os.listdir(absolute_path):
-            if file.endswith(".properties"):
-                self.directories_dict[absolute_path].append(absolute_path + file)
-                self.addProperty(Properties(os.path.join(absolute_path + file), is_absolute=True))
-
-    def addDirectory(self, relative_path: str, name: str = None, is_absolute: bool = False):
+        self._directory_files = {absolute_path: set()}
+        self._lazy_directories = set()
+        self._clearProperties()
+        self._loadDirectory(absolute_path, workers, use_processes, lazy, snapshot)
+
+    @_locked
+    def addDirectory(self, relative_path: str, name: str = None, is_absolute: bool = False, workers: int = 0,
+                     use_processes: bool = False, lazy: bool = False, snapshot: str = None):
         """Used to add a directory to the Properties directories list
                 :param relative_path: relative path to directory or absolute if is_absolute is True
         :param is_absolute: boolean of whether or not the path given is absolute
         :param name: name to be given to the directory, if not: defaults to dir name
+        :param workers: number of files loaded in parallel, 0 loads them one by one
+        :param use_processes: if True uses a process pool instead of a thread pool (for large files, parsing bound)
+        :param lazy: if True files are only parsed when first used (see LazyProperties), workers are then ignored
+        :param snapshot: path of a file caching the whole parsed directory, unchanged files are read from it instead of
+        being parsed and it is rewritten when files changed (ignored if lazy)
+        """
+        absolute_path, already_loaded = self._registerDirectory(relative_path, name, is_absolute)
+        if already_loaded:
+            return self.updateDirectory(absolute_path=absolute_path)
+        self._loadDirectory(absolute_path, workers, use_processes, lazy, snapshot)
+
+    async def aaddDirectory(self, relative_path: str, name: str = None, is_absolute: bool = False,
+                            concurrency: int = 8, lazy: bool = False, executor=None):
+        """Same as addDirectory, listing and parsing the files in an executor instead of the event loop, the
+        Properties objects are added from the event loop
+        :param concurrency: maximum number of files parsed at the same time
+        :param executor: concurrent.futures executor, None uses the event loop's default one
+        """
+        import asyncio
+        absolute_path, already_loaded = self._registerDirectory(relative_path, name, is_absolute)
+        if already_loaded:
+            return await self.aupdateDirectory(absolute_path=absolute_path, concurrency=concurrency, executor=executor)
+        paths = await asyncio.get_running_loop().run_in_executor(executor, self._directoryFiles, absolute_path)
+        if lazy:
+            self._lazy_directories.add(absolute_path)
+            factories = [functools.partial(self._newLazyProperties, path) for path in paths]
+        else:
+            self._lazy_directories.discard(absolute_path)
+            factories = [functools.partial(Properties, path, is_absolute=True) for path in paths]
+        self._addDirectoryFiles(absolute_path, paths, await _aloadFiles(factories, concurrency, executor))
+
+    @_locked
+    def _registerDirectory(self, relative_path: str, name: Optional[str], is_absolute: bool) -> tuple[str, bool]:
+        """Registers a directory under name (defaults to the directory name)
+        :return: (absolute path ending with the platform separator, False), or (absolute path of the directory already
+        registered under the default name, True)
         """
-
         if not is_absolute:
             absolute_path = str(os.getcwd()) + self.platformSeparator + clean_path(relative_path)
         else:
@@ -369,24 +2007,56 @@ class PropertiesHandler:
             name = absolute_path.split(self.platformSeparator)[-1]
             if self.directories_name_dict.__contains__(name):  ##TODO: multiple directories may have the same name but are not on the same path
                 print(f"Directory '{name}' already loaded. Reloading...")
-                return self.updateDirectory(absolute_path=self.directories_name_dict.get(name))
+                return self.directories_name_dict.get(name), True
 
         if not absolute_path.endswith(self.platformSeparator):
             absolute_path += self.platformSeparator
         self.directories_name_dict[name] = absolute_path
         self.directories_dict[absolute_path] = []
-        for file in os.listdir(absolute_path):
-            if file.endswith(".properties"):
-                self.directories_dict[absolute_path].append(absolute_path + file)
-                self.addProperty(Properties(os.path.join(absolute_path + file), is_absolute=True))
+        self._directory_files[absolute_path] = set()
+        return absolute_path, False
+
+    @staticmethod
+    def _directoryFiles(absolute_path: str) -> list[str]:
+        """:return: paths of the .properties files of a directory, in sorted file name order"""
+        return [absolute_path + file for file in sorted(os.listdir(absolute_path)) if file.endswith(".properties")]
+
+    def _loadDirectory(self, absolute_path: str, workers: int = 0, use_processes: bool = False, lazy: bool = False,
+                       snapshot: str = None):
+        """Loads every .properties file of a registered directory, in sorted file name order
+        :param absolute_path: absolute path to the directory, ending with the platform separator
+        """
+        paths = self._directoryFiles(absolute_path)
+        if lazy:
+            self._lazy_directories.add(absolute_path)
+            props = [self._newLazyProperties(path) for path in paths]
+        elif snapshot:
+            self._lazy_directories.discard(absolute_path)
+            props = _loadSnapshot(snapshot, paths, workers, use_processes)
+        else:
+            self._lazy_directories.discard(absolute_path)
+            props = _loadFiles([(path, {'is_absolute': True}) for path in paths], workers, use_processes)
+        self._addDirectoryFiles(absolute_path, paths, props)
 
+    @_locked
+    def _addDirectoryFiles(self, absolute_path: str, paths: list[str], props: list[Properties]):
+        for path, prop in zip(paths, props):
+            self._addDirectoryFile(absolute_path, path)
+            self.addProperty(prop)
+
+    def _addDirectoryFile(self, absolute_path: str, path: str):
+        self.directories_dict[absolute_path].append(path)
+        self._directory_files[absolute_path].add(path)
+
+    @_locked
     def removeDirectories(self):
         """Removes every directory added to the Directories list
         Keeps externally added files"""
-        print(f'{list(self.directories_dict.values())=}')
+        logger.debug('Removing directories: %s', self.directories_dict)
         for absolute_path in copy.deepcopy(list(self.directories_dict.keys())):
             self.removeDirectory(absolute_path=absolute_path, is_absolute=True)
 
+    @_locked
     def removeDirectory(self, **kwargs):
         """Removes a directory and it's properties objects from the directories list
         :key relative_path: relative path to directory
@@ -411,28 +2081,123 @@ class PropertiesHandler:
             absolute_path += self.platformSeparator
         if absolute_path not in self.directories_dict.keys():
             raise AttributeError(f"Directory '{absolute_path}' isn't registered.")
+        removed = set()
         for prop_path in self.directories_dict[absolute_path]:
-            prop = self._getPropertyByPath(prop_path)
-            if self.curr_prop == prop:
+            prop_name = self._getNameByPath(prop_path)
+            if prop_name is None:
+                continue
+            prop = self.properties_dict.pop(prop_name)
+            self._unindex(prop_name, prop)
+            removed.add(prop_name)
+            if self.curr_prop is prop:
                 self.curr_prop = None
-            self.properties_dict.pop(list(self.properties_dict.keys())
-                                     [list(self.properties_dict.values()).index(prop)])
+        self._order = [prop_name for prop_name in self._order if prop_name not in removed]
+        self._curr_index = -1
         if len(self.properties_dict) > 0 and self.curr_prop is None:
-            self.curr_prop = list(self.properties_dict.values())[0]
+            self._setCurrent(0)
+        self._lazy_directories.discard(absolute_path)
+        self._directory_files.pop(absolute_path, None)
         return self.directories_dict.pop(absolute_path)
 
-    def updateDirectories(self):
-        """Reloads every Properties objects contained in every stored directory
-        and adds new files that were created after previous loading"""
-        for absolute_path in self.directories_dict.keys():
-            self.updateDirectory(absolute_path=absolute_path)
+    def updateDirectories(self, force: bool = False, check_hash: bool = False) -> dict[str, dict[str, list[str]]]:
+        """Reloads every modified Properties objects contained in every stored directory
+        and adds new files that were created after previous loading
+        :param force: if True reloads every file even if it didn't change
+        :param check_hash: compare content hashes instead of stat signatures
+        :return: dict of directory path -> report returned by updateDirectory
+        """
+        return {absolute_path: self.updateDirectory(absolute_path=absolute_path, force=force, check_hash=check_hash)
+                for absolute_path in list(self.directories_dict.keys())}
 
+    @_locked
     def updateDirectory(self, **kwargs):
         """Reloads every Properties objects contained in a stored directory
-        and adds new files that were created after previous loading
+        and adds new files that were created after previous loading, unchanged files are not reloaded
         :key relative_path: relative path to directory
         :key absolute_path: absolute path to directory
-        :key name: name of directory (in the dict_names dictionnary)"""
+        :key name: name of directory (in the dict_names dictionnary)
+        :key force: if True reloads every file even if it didn't change
+        :key check_hash: compare content hashes instead of stat signatures (for filesystems with coarse mtimes), files
+        loaded without hash_content are reported changed once, when their hash is first stored
+        :return: dict with the 'added', 'changed', 'unchanged' and 'removed' files paths"""
+        force = kwargs.get("force", False)
+        check_hash = kwargs.get("check_hash", False)
+        absolute_path = self._directoryPath(kwargs)
+        if absolute_path is None:
+            return None
+        logger.debug('Updating files at %s', absolute_path)
+        start = time.perf_counter()
+        report = {'added': [], 'changed': [], 'unchanged': [], 'removed': []}
+        paths = self._directoryFiles(absolute_path)
+        for fileName in paths:
+            change = self._updateFile(absolute_path, fileName, force, check_hash)
+            if change in report:
+                report[change].append(fileName)
+        self._removeMissing(absolute_path, paths, report)
+        self._emitUpdated(absolute_path, report, start)
+        return report
+
+    async def aupdateDirectories(self, force: bool = False, check_hash: bool = False, concurrency: int = 8,
+                                 executor=None) -> dict[str, dict[str, list[str]]]:
+        """Same as updateDirectories, see aupdateDirectory"""
+        return {absolute_path: await self.aupdateDirectory(absolute_path=absolute_path, force=force,
+                                                           check_hash=check_hash, concurrency=concurrency,
+                                                           executor=executor)
+                for absolute_path in list(self.directories_dict.keys())}
+
+    async def aupdateDirectory(self, **kwargs):
+        """Same as updateDirectory, checking and parsing the files in an executor instead of the event loop, new
+        Properties objects are added from the event loop
+        :key concurrency: maximum number of files checked or parsed at the same time (default:8)
+        :key executor: concurrent.futures executor, None uses the event loop's default one
+        """
+        import asyncio
+        force = kwargs.get("force", False)
+        check_hash = kwargs.get("check_hash", False)
+        executor = kwargs.get("executor", None)
+        absolute_path = self._directoryPath(kwargs)
+        if absolute_path is None:
+            return None
+        logger.debug('Updating files at %s', absolute_path)
+        start = time.perf_counter()
+        paths = await asyncio.get_running_loop().run_in_executor(executor, self._directoryFiles, absolute_path)
+        registered = set(self._directory_files[absolute_path])
+        lazy = absolute_path in self._lazy_directories
+
+        def update(path: str) -> tuple[str, Properties]:
+            if path not in registered:
+                return 'added', self._newLazyProperties(path) if lazy else Properties(path, is_absolute=True)
+            prop = self._getPropertyByPath(path)
+            return 'changed' if prop.reload(only_if_modified=not force, check_hash=check_hash) else 'unchanged', prop
+
+        results = await _aloadFiles([functools.partial(update, path) for path in paths],
+                                    kwargs.get("concurrency", 8), executor)
+        report = {'added': [], 'changed': [], 'unchanged': [], 'removed': []}
+        with self._lock:
+            for path, (change, prop) in zip(paths, results):
+                if change == 'added':
+                    if path in self._directory_files[absolute_path]:  ## Added by someone else meanwhile
+                        continue
+                    self.addProperty(prop)
+                    self._addDirectoryFile(absolute_path, path)
+                report[change].append(path)
+            self._removeMissing(absolute_path, paths, report)
+        self._emitUpdated(absolute_path, report, start)
+        return report
+
+    def _removeMissing(self, absolute_path: str, paths: list[str], report: dict[str, list[str]]):
+        """Removes the registered files of a directory which are no longer on disk, adding them to report['removed']
+        :param paths: the .properties files listed in the directory
+        """
+        listed = set(paths)
+        for path in [path for path in self.directories_dict[absolute_path] if path not in listed]:
+            if self._updateFile(absolute_path, path) == 'removed':
+                report['removed'].append(path)
+
+    def _directoryPath(self, kwargs: dict) -> Optional[str]:
+        """Used to get the absolute path of a directory from the name, relative_path or absolute_path keys
+        :return: the path ending with the platform separator, None if there is no directory with the name given
+        """
         relative_path = kwargs.get("relative_path", False)
         absolute_path = kwargs.get("absolute_path", False)
         name = kwargs.get("name", False)
@@ -445,45 +2210,351 @@ class PropertiesHandler:
         elif relative_path:
             absolute_path = str(os.getcwd()) + self.platformSeparator + clean_path(str(relative_path))
 
-        absolute_path = clean_path(absolute_path) + self.platformSeparator
-        print(f"\nUpdating files at {absolute_path}")
-        for file in os.listdir(absolute_path):
-            if file.endswith(".properties"):
-                fileName = absolute_path + file
-                if fileName not in self.directories_dict[absolute_path]:
-                    self.addProperty(Properties(os.path.join(absolute_path + file), is_absolute=True))
-                    self.directories_dict[absolute_path].append(absolute_path + file)
-                else:
-                    self._getPropertyByPath(fileName).reload()
-
-    def reloadAll(self):
-        """Reloads every Properties objects"""
-        for prop in self.properties_dict.values():
-            prop.reload()
+        return clean_path(absolute_path) + self.platformSeparator
+
+    @staticmethod
+    def _emitUpdated(absolute_path: str, report: dict[str, list[str]], start: float):
+        if _event_hooks or logger.isEnabledFor(logging.DEBUG):
+            _emit({'event': 'directory_updated', 'path': absolute_path, 'added': len(report['added']),
+                   'changed': len(report['changed']), 'unchanged': len(report['unchanged']),
+                   'removed': len(report['removed']), 'duration': time.perf_counter() - start},
+                  'Updated %(path)s: %(added)d added, %(changed)d changed, %(unchanged)d unchanged, '
+                  '%(removed)d removed in %(duration).6fs')
+
+    @_locked
+    def _updateFile(self, absolute_path: str, path: str, force: bool = False, check_hash: bool = False) -> Optional[str]:
+        """Brings one file of a registered directory up to date: adds it if it is new, reloads it if it changed and
+        removes it if it was deleted
+        :param absolute_path: absolute path to the registered directory, ending with the platform separator
+        :param path: absolute path to the file
+        :return: 'added', 'changed', 'unchanged' or 'removed', None if the file is neither on disk nor registered
+        """
+        paths = self._directory_files[absolute_path]
+        if not os.path.isfile(path):
+            if path not in paths:
+                return None
+            paths.discard(path)
+            self.directories_dict[absolute_path].remove(path)
+            if self._getNameByPath(path) is not None:
+                self.removeProperty(absolute_path=path)
+            return 'removed'
+        if path not in paths:
+            if absolute_path in self._lazy_directories:
+                self.addProperty(self._newLazyProperties(path))
+            else:
+                self.addProperty(Properties(path, is_absolute=True))
+            self._addDirectoryFile(absolute_path, path)
+            return 'added'
+        if self._getPropertyByPath(path).reload(only_if_modified=not force, check_hash=check_hash):
+            return 'changed'
+        return 'unchanged'
+
+    def watch(self, interval: float = 1.0, debounce: float = 0.2, use_inotify: bool = None) -> 'DirectoryWatcher':
+        """Starts a background thread applying the changes made on disk to the registered directories (including the
+        ones added later), see DirectoryWatcher
+        :param interval: seconds between two scans when polling
+        :param debounce: seconds a file must stay untouched before its change is applied
+        :param use_inotify: True to require inotify, False to poll, None uses inotify when available
+        :return: the running DirectoryWatcher, the same one if already watching. The handler becomes thread safe (see
+        thread_safe) as the watching thread changes it too
+        """
+        from .watcher import DirectoryWatcher
+        if self._watcher is None or not self._watcher.isAlive():
+            self._watcher = DirectoryWatcher(self, interval, debounce, use_inotify).start()
+        return self._watcher
+
+    def _makeThreadSafe(self):
+        """Gives the handler a lock if it has none, must be called before another thread starts changing it"""
+        if self._lock is _NO_LOCK:
+            self._lock = threading.RLock()
+
+    def stopWatching(self):
+        """Stops the thread started by watch(), if any"""
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
+
+    @_locked
+    def reloadAll(self, force: bool = False, check_hash: bool = False) -> list[str]:
+        """Reloads every modified Properties objects
+        :param force: if True reloads every file even if it didn't change
+        :param check_hash: compare content hashes instead of stat signatures
+        :return: list of the names of the reloaded Properties objects
+        """
+        return [name for name, prop in self.properties_dict.items()
+                if prop.reload(only_if_modified=not force, check_hash=check_hash)]
 
-    def _getPropertyByPath(self, path: str) -> Properties:
+    def _getPropertyByPath(self, path: str) -> Optional[Properties]:
         """Used to get a Property object using it's absolute path
         :param path: str, absolute path to the property
         """
-        for prop in self.properties_dict.values():
+        return self.properties_dict.get(self._getNameByPath(path))
+
+    def _getNameByPath(self, path: str) -> Optional[str]:
+        """Used to get the name of a Property object using it's absolute path
+        :param path: str, absolute path to the property
+        """
+        names = self._path_index.get(path)
+        if names is None:
+            return None
+        prop = self.properties_dict.get(names[0])
+        if prop is not None and prop.getPath() == path:
+            return names[0]
+        del self._path_index[path]  ## Stale, properties_dict or a path was changed from outside the handler
+        for name, prop in self.properties_dict.items():
             if prop.getPath() == path:
-                return prop
+                self._path_index[path] = [name]
+                return name
+        return None
 
+    def getName(self, prop: Properties) -> Optional[str]:
+        """Used to get the name of a stored Properties object
+        :param prop: Properties object
+        :return: name of the object in the internal dict, None if it isn't stored
+        """
+        names = self._name_index.get(id(prop))
+        if names is None:
+            return None
+        if self.properties_dict.get(names[0]) is prop:
+            return names[0]
+        del self._name_index[id(prop)]  ## Stale, properties_dict was changed from outside the handler
+        for name, other in self.properties_dict.items():
+            if other is prop:
+                self._name_index[id(prop)] = [name]
+                return name
+        return None
+
+    def _findName(self, kwargs: dict) -> Optional[str]:
+        """Used to get the name of a Properties object from the name, index, relative_path or absolute_path keys"""
+        name = kwargs.get('name', False)
+        index = kwargs.get('index', 'False')
+        relative_path = kwargs.get('relative_path', False)
+        absolute_path = kwargs.get('absolute_path', False)
+        if name:
+            if not self.properties_dict.__contains__(name):
+                raise KeyError(f'Unknown key {name}')
+            return name
+        elif isinstance(index, int):
+            if len(self.properties_dict) <= index or index < -len(self.properties_dict):
+                raise IndexError(
+                    f"index '{index}' out of bounds: max={len(self.properties_dict) - 1}, min={-len(self.properties_dict)}")
+            return self._order[index]
+        elif isinstance(relative_path, str):
+            absolute_path = str(os.getcwd()) + self.platformSeparator + clean_path(relative_path)
+        elif not isinstance(absolute_path, str):
+            return None
+        return self._getNameByPath(clean_path(absolute_path))
+
+    def _clearProperties(self):
+        """Removes every Properties object and resets the indexes"""
+        for name in list(self._path_listeners):
+            self._unindexPath(name)
+        self.properties_dict = {}
+        self._path_index = {}
+        self._name_index = {}
+        self._next_num = 1
+        self._free_nums = []
+        self._order = []
+        self._curr_index = -1
+        self._lazy_loaded = OrderedDict()
+        self.curr_prop = None
+        self._names_version += 1
+        for name in list(self._key_listeners):
+            self._unindexKeys(name)
+        self._name_keys = {}
+        if self._key_names is not None:
+            self._key_names = {}
+
+    def _newLazyProperties(self, path: str) -> LazyProperties:
+        prop = LazyProperties(path, is_absolute=True)
+        prop.on_load = self._markUsed
+        return prop
+
+    def _markUsed(self, prop: Properties):
+        """Parses a LazyProperties object if needed and marks it as most recently used,
+        unloads the least recently used ones over max_loaded"""
+        if not isinstance(prop, LazyProperties) or prop.on_load != self._markUsed:
+            return
+        if not prop.isLoaded():
+            prop.getContent()  ## Calls back _markUsed once parsed
+            return
+        with self._lock:
+            self._lazy_loaded[id(prop)] = prop
+            self._lazy_loaded.move_to_end(id(prop))
+            while self.max_loaded and len(self._lazy_loaded) > self.max_loaded:
+                self._lazy_loaded.popitem(last=False)[1].unload()
+
+    def _removeName(self, name: str) -> Properties:
+        """Pops a Properties object from the internal dict and its indexes"""
+        prop = self.properties_dict.pop(name)
+        curr_index = self._curr_index
+        if 0 <= curr_index < len(self._order) and self._order[curr_index] == name:
+            del self._order[curr_index]
+            self._curr_index = -1
+        else:
+            index = self._order.index(name)
+            del self._order[index]
+            if index < curr_index:
+                self._curr_index -= 1
+        self._unindex(name, prop)
+        return prop
+
+    def _unindex(self, name: str, prop: Properties):
+        """Removes a name from the path and object indexes, its number can be reused for automatic names"""
+        self._names_version += 1
+        if name in self._key_listeners:
+            self._unindexKeys(name)
+        if name in self._path_listeners:
+            self._unindexPath(name)
+        _dropIndexed(self._name_index, id(prop), name)
+        if isinstance(prop, LazyProperties) and prop.on_load == self._markUsed:
+            prop.on_load = None
+            self._lazy_loaded.pop(id(prop), None)
+        num = name[4:]
+        if name.startswith('prop') and num.isdigit() and str(int(num)) == num and int(num) < self._next_num:
+            heapq.heappush(self._free_nums, int(num))  ## Numbers above _next_num are still free, never handed out
+
+    def _indexPath(self, name: str, prop: Properties):
+        """Adds a Properties object to the path index and follows the loads changing its path"""
+        path = prop.getPath()
+        if path:
+            self._path_index.setdefault(path, []).append(name)
+        listener = functools.partial(self._pathChanged, name)
+        if prop._listeners is None:
+            prop._listeners = []
+        prop._listeners.append(listener)
+        self._path_listeners[name] = (prop, listener, path)
+
+    def _unindexPath(self, name: str):
+        prop, listener, path = self._path_listeners.pop(name)
+        if prop._listeners and listener in prop._listeners:
+            prop._listeners.remove(listener)
+        _dropIndexed(self._path_index, path, name)
+
+    def _pathChanged(self, name: str, prop: Properties, key: Optional[str]):
+        """Listener of the stored Properties objects, see Properties._changed"""
+        if key is not None:  ## Only loads change the path
+            return
+        with self._lock:
+            indexed = self._path_listeners.get(name)
+            path = prop.getPath()
+            if indexed is None or indexed[0] is not prop or indexed[2] == path:
+                return
+            _dropIndexed(self._path_index, indexed[2], name)
+            if path:
+                self._path_index.setdefault(path, []).append(name)
+            self._path_listeners[name] = (prop, indexed[1], path)
+
+    def _indexKeys(self, name: str, prop: Properties):
+        """Adds the keys of a Properties object to the key index and follows its changes"""
+        self._name_keys[name] = keys = list(prop.getKeySet())
+        self._addKeyNames(keys, name)
+        listener = functools.partial(self._keysChanged, name)
+        if prop._listeners is None:
+            prop._listeners = []
+        prop._listeners.append(listener)
+        self._key_listeners[name] = (prop, listener)
+
+    def _unindexKeys(self, name: str):
+        prop, listener = self._key_listeners.pop(name)
+        if prop._listeners and listener in prop._listeners:
+            prop._listeners.remove(listener)
+        for key in self._name_keys.pop(name):
+            self._dropKeyName(key, name)
+
+    def _addKeyNames(self, keys, name: str):
+        key_names = self._key_names
+        for key in keys:
+            names = key_names.get(key)
+            if names is None:
+                key_names[key] = {name}
+            else:
+                names.add(name)
+
+    def _dropKeyName(self, key: str, name: str):
+        names = self._key_names.get(key)
+        if names is not None and name in names:
+            names.discard(name)
+            if not names:
+                del self._key_names[key]
+
+    def _keysChanged(self, name: str, prop: Properties, key: Optional[str]):
+        """Listener of the indexed Properties objects, see Properties._changed"""
+        with self._lock:
+            if name not in self._key_listeners or self._key_listeners[name][0] is not prop:
+                return
+            if key is None:  ## Loaded again
+                new_keys = list(prop.getKeySet())  ## Parses an unloaded LazyProperties, which calls back first
+                keys, self._name_keys[name] = self._name_keys[name], new_keys
+                for removed in keys:
+                    if not prop.containsProperty(removed):
+                        self._dropKeyName(removed, name)
+                self._addKeyNames(new_keys, name)
+            elif not prop.containsProperty(key):
+                self._dropKeyName(key, name)  ## Left in _name_keys, dropped again if still there on next reload
+            else:
+                names = self._key_names.get(key)
+                if names is None or name not in names:
+                    self._addKeyNames((key,), name)
+                    keys = self._name_keys[name]
+                    keys.append(key)
+                    if len(keys) > 2 * len(prop.getKeySet()) + 16:  ## Keys set and removed over and over
+                        self._name_keys[name] = list(prop.getKeySet())
+
+    def _currIndex(self) -> int:
+        """Used to get the index of curr_prop in _order, found again if curr_prop was changed from outside"""
+        index = self._curr_index
+        if 0 <= index < len(self._order) and self.properties_dict.get(self._order[index]) is self.curr_prop:
+            return index
+        self._curr_index = self._order.index(self.getName(self.curr_prop))
+        return self._curr_index
+
+    def _setCurrent(self, index: int):
+        self._curr_index = index
+        self.curr_prop = self.properties_dict[self._order[index]]
+
+    def _autoName(self, prop: Properties) -> str:
+        """Used to get the name of a Properties object added without one, the smallest free prop+a_number name
+        (or the file name if name_by_stem is set)"""
+        if self.name_by_stem and prop.getPath():
+            name = os.path.splitext(os.path.basename(prop.getPath()))[0]
+            if not self.properties_dict.__contains__(name):
+                return name
+        while self._free_nums:
+            name = 'prop' + str(heapq.heappop(self._free_nums))
+            if not self.properties_dict.__contains__(name):
+                return name
+        name = 'prop' + str(self._next_num)
+        while self.properties_dict.__contains__(name):
+            self._next_num += 1
+            name = 'prop' + str(self._next_num)
+        self._next_num += 1
+        return name
+
+    @_locked
     def addProperty(self, prop: Properties, name: str = ''):
         """Adds a Properties object
         :param prop: Properties object
         :param name: name of the prop in the dict, will default to prop+a_number to fill the list
+        (or to the file name if the handler was created with name_by_stem=True)
         """
         if not name:
-            num = 1
-            name = 'prop' + str(num)
-            while self.properties_dict.__contains__(name):
-                num += 1
-                name = 'prop' + str(num)
+            name = self._autoName(prop)
+        elif self.properties_dict.__contains__(name):
+            self._unindex(name, self.properties_dict[name])
+        if not self.properties_dict.__contains__(name):
+            self._order.append(name)
         self.properties_dict[name] = prop
+        self._names_version += 1
+        if self._key_names is not None:
+            self._indexKeys(name, prop)
+        self._indexPath(name, prop)
+        self._name_index.setdefault(id(prop), []).append(name)
         if not self.curr_prop:
             self.curr_prop = prop
+            self._curr_index = -1
 
+    @_locked
     def removeProperty(self, **kwargs) -> Optional['Properties']:
         """Used to remove a Properties object, returns the removed Properties class
         :key relative_path: relative path to property
@@ -492,41 +2563,22 @@ class PropertiesHandler:
         :key name: name of the property
         :return: the popped object
         """
-        name = kwargs.get('name', False)
-        index = kwargs.get('index', 'False')
-        relative_path = kwargs.get('relative_path', False)
-        absolute_path = kwargs.get('absolute_path', False)
-        prop: Optional[Properties] = None
-        if isinstance(name, str):
-            if not self.properties_dict.__contains__(name):
-                raise KeyError(f'Unknown key {name}')
-            prop = self.properties_dict.get(name)
-        elif isinstance(index, int):
-            if len(self.properties_dict) <= index or index < -len(self.properties_dict):
-                raise IndexError(
-                    f"index '{index}' out of bounds: max={len(self.properties_dict) - 1}, min={-len(self.properties_dict)}")
-            prop = self.properties_dict.get(list(self.properties_dict.keys())[index])
-        elif isinstance(relative_path, str):
-            absolute_path = str(os.getcwd()) + self.platformSeparator + clean_path(relative_path)
-            absolute_path = clean_path(absolute_path)
-            prop = self._getPropertyByPath(absolute_path)
-        elif isinstance(absolute_path, str):
-            absolute_path = clean_path(absolute_path)
-            prop = self._getPropertyByPath(absolute_path)
-
-        if prop == self.curr_prop and prop is not None:
-            curr_index = list(self.properties_dict.values()).index(prop)
-
-            if curr_index == 0:
-                self.switchUp()
-            else:
-                self.switchDown()
-        try:
-            return self.properties_dict.pop(list(self.properties_dict.keys())
-                                            [list(self.properties_dict.values()).index(prop)])
-        except ValueError:
-            return print(f"Property {absolute_path.split(self.platformSeparator)[-1]} not loaded. Skipping...")
-
+        name = self._findName(kwargs)
+        if name is None:
+            path = str(kwargs.get('absolute_path', False) or kwargs.get('relative_path', ''))
+            return print(f"Property {clean_path(path).split(self.platformSeparator)[-1]} not loaded. Skipping...")
+        if self.properties_dict[name] is not self.curr_prop:
+            return self._removeName(name)
+
+        curr_index = self._currIndex()
+        prop = self._removeName(name)
+        if not self._order:
+            self.curr_prop = None
+        else:  ## The next object takes the place of the first one, any other is replaced by the previous one
+            self._setCurrent(0 if curr_index == 0 else curr_index - 1)
+        return prop
+
+    @_locked
     def changeProperty(self, **kwargs):
         """Used to change between Properties objects
         :key relative_path: relative path to property
@@ -534,34 +2586,12 @@ class PropertiesHandler:
         :key absolute_path: absolute path to property
         :key name: name of the property
         """
-        name = kwargs.get('name', False)
-        index = kwargs.get('index', 'False')
-        relative_path = kwargs.get('relative_path', False)
-        absolute_path = kwargs.get('absolute_path', False)
-        if name:
-            if not self.properties_dict.__contains__(name):
-                raise KeyError(f'Unknown key {name}')
-            self.curr_prop = self.properties_dict.get(str(name), None)
-        elif isinstance(index, int):
-            if len(self.properties_dict) <= index or index < -len(self.properties_dict):
-                raise IndexError(
-                    f"index '{index}' out of bounds: max={len(self.properties_dict) - 1}, min={-len(self.properties_dict)}")
-            self.curr_prop = self.properties_dict.get(list(self.properties_dict.keys())[index])
-        elif isinstance(relative_path, str):
-            absolute_path = str(os.getcwd()) + self.platformSeparator + clean_path(relative_path)
-            absolute_path = clean_path(absolute_path)
-            for prop in list(self.properties_dict.values()):
-                if prop.getPath() == absolute_path:
-                    self.curr_prop = self.properties_dict.get(
-                        list(self.properties_dict.keys())[list(self.properties_dict.values()).index(prop)])
-                    break
-        elif isinstance(absolute_path, str):
-            absolute_path = clean_path(absolute_path)
-            for prop in list(self.properties_dict.values()):
-                if prop.getPath() == absolute_path:
-                    self.curr_prop = self.properties_dict.get(
-                        list(self.properties_dict.keys())[list(self.properties_dict.values()).index(prop)])
-                    break
+        name = self._findName(kwargs)
+        if name is not None:
+            self.curr_prop = self.properties_dict.get(name)
+            self._markUsed(self.curr_prop)
+            index = kwargs.get('index', 'False')
+            self._curr_index = index % len(self._order) if isinstance(index, int) else -1
 
     def getProperty(self, **kwargs):
         """Used to get a Properties object
@@ -570,44 +2600,72 @@ class PropertiesHandler:
         :key absolute_path: absolute path to property
         :key name: name of the property
         """
-        name = kwargs.get('name', False)
-        index = kwargs.get('index', 'False')
-        relative_path = kwargs.get('relative_path', False)
-        absolute_path = kwargs.get('absolute_path', False)
-        if name:
-            if not self.properties_dict.__contains__(name):
-                raise KeyError(f'Unknown key {name}')
-            return self.properties_dict.get(str(name))
-        elif isinstance(index, int):
-            if len(self.properties_dict) <= index or index < -len(self.properties_dict):
-                raise IndexError(
-                    f"index '{index}' out of bounds: max={len(self.properties_dict) - 1}, min={-len(self.properties_dict)}")
-            return self.properties_dict.get(list(self.properties_dict.keys())[index])
-        elif isinstance(relative_path, str):
-            absolute_path = str(os.getcwd()) + self.platformSeparator + clean_path(relative_path)
-            absolute_path = clean_path(absolute_path)
-            for prop in list(self.properties_dict.values()):
-                if prop.getPath() == absolute_path:
-                    return self.properties_dict.get(
-                        list(self.properties_dict.keys())[list(self.properties_dict.values()).index(prop)])
-        elif isinstance(absolute_path, str):
-            absolute_path = clean_path(absolute_path)
-            for prop in list(self.properties_dict.values()):
-                if prop.getPath() == absolute_path:
-                    return self.properties_dict.get(
-                        list(self.properties_dict.keys())[list(self.properties_dict.values()).index(prop)])
+        prop = self.properties_dict.get(self._findName(kwargs))
+        if prop is not None:
+            self._markUsed(prop)
+        return prop
+
+    def getNamesWithKey(self, key: str) -> set[str]:
+        """Used to know which stored Properties objects define a key
+        :param key: the key to look for
+        :return: set of names of the Properties objects
+        """
+        with self._lock:
+            if self._key_names is not None:
+                return set(self._key_names.get(key, ()))
+            return {name for name, prop in self.properties_dict.items() if prop.containsProperty(key)}
+
+    def getNamesWithoutKey(self, key: str) -> list[str]:
+        """Used to know which stored Properties objects don't define a key
+        :param key: the key to look for
+        :return: list of names of the Properties objects, in the order they were added
+        """
+        with self._lock:
+            names = self.getNamesWithKey(key)
+            return [name for name in self.properties_dict if name not in names]
+
+    def getMissingKeys(self, reference: str = None) -> dict[str, list[str]]:
+        """Used to find the keys some stored Properties objects are missing, e.g. untranslated keys of locale files.
+        With the key index (see key_index) only the keys not defined by every object are checked
+        :param reference: name of the Properties object whose keys every other one should define, None to check the
+        keys defined by any of them
+        :return: dict of name -> sorted list of its missing keys, names missing none are left out
+        """
+        with self._lock:
+            key_names = self._key_names
+            if key_names is None:
+                key_names = {}
+                for name, prop in self.properties_dict.items():
+                    for key in prop.getKeySet():
+                        key_names.setdefault(key, set()).add(name)
+            keys = key_names if reference is None else self.properties_dict[reference].getKeySet()
+            all_names = set(self.properties_dict)
+            missing = {}
+            for key in keys:
+                names = key_names.get(key, ())
+                if len(names) < len(all_names):
+                    for name in all_names.difference(names):
+                        missing.setdefault(name, []).append(key)
+            return {name: sorted(missing[name]) for name in self.properties_dict if name in missing}
+
+    def getLayered(self, *names: str) -> LayeredProperties:
+        """Used to resolve keys through several Properties objects of the handler, see LayeredProperties
+        :param names: names of the Properties objects, highest priority first
+        :return: LayeredProperties over them, it keeps the objects even if they are later removed from the handler
+        """
+        return LayeredProperties([self.properties_dict[self._findName({'name': name})] for name in names])
 
+    @_locked
     def switchUp(self):
         """Switches to the next Properties object in the internal dict (or to the first one if the last is passed)"""
-        curr_pos = list(self.properties_dict.values()).index(self.curr_prop)
-        next_pos = curr_pos + 1 if curr_pos + 1 < len(self.properties_dict) else 0
-        self.curr_prop = self.properties_dict.get(list(self.properties_dict.keys())[next_pos])
+        curr_pos = self._currIndex()
+        self._setCurrent(curr_pos + 1 if curr_pos + 1 < len(self._order) else 0)
 
+    @_locked
     def switchDown(self):
         """Switches to the previous Properties object in the internal dict (or to the last one if the first is passed)"""
-        curr_pos = list(self.properties_dict.values()).index(self.curr_prop)
-        next_pos = len(self.properties_dict) - 1 if curr_pos - 1 < 0 else curr_pos - 1
-        self.curr_prop = self.properties_dict.get(list(self.properties_dict.keys())[next_pos])
+        curr_pos = self._currIndex()
+        self._setCurrent(len(self._order) - 1 if curr_pos - 1 < 0 else curr_pos - 1)
 
     def getProperties(self) -> ValuesView:
         """Used to get the values (Properties objects) of the internal dict
@@ -631,8 +2689,11 @@ class PropertiesHandler:
         """Used to get the current Properties object
         :return: Current selected Properties object
         """
+        if self.curr_prop is not None:
+            self._markUsed(self.curr_prop)
         return self.curr_prop
 
+    @_locked
     def closeProp(self, **kwargs):
         """Used to close a Properties object (basically clear it), and keep it in memory
         :key relative_path: relative path to property
@@ -640,43 +2701,54 @@ class PropertiesHandler:
         :key absolute_path: absolute path to property
         :key name: name of the property
         """
-        name = kwargs.get('name', False)
-        index = kwargs.get('index', 'False')
-        relative_path = kwargs.get('relative_path', False)
-        absolute_path = kwargs.get('absolute_path', False)
-        prop: Optional[Properties] = None
-        if isinstance(name, str):
-            if not self.properties_dict.__contains__(name):
-                raise KeyError(f'Unknown key {name}')
-            prop = self.properties_dict.get(name)
-        elif isinstance(index, int):
-            if len(self.properties_dict) <= index or index < -len(self.properties_dict):
-                raise IndexError(
-                    f"index '{index}' out of bounds: max={len(self.properties_dict) - 1}, min={-len(self.properties_dict)}")
-            prop = self.properties_dict.get(list(self.properties_dict.keys())[index])
-        elif isinstance(relative_path, str):
-            absolute_path = str(os.getcwd()) + self.platformSeparator + relative_path
-            absolute_path = clean_path(absolute_path)
-            for prop in list(self.properties_dict.values()):
-                if prop.getPath() == absolute_path:
-                    prop = self.properties_dict.get(
-                        list(self.properties_dict.keys())[list(self.properties_dict.values()).index(prop)])
-                    break
-        elif isinstance(absolute_path, str):
-            absolute_path = clean_path(absolute_path)
-            for prop in list(self.properties_dict.values()):
-                if prop.getPath() == absolute_path:
-                    prop = self.properties_dict.get(
-                        list(self.properties_dict.keys())[list(self.properties_dict.values()).index(prop)])
-                    break
-
-        if prop == self.curr_prop:
-            curr_index = list(self.properties_dict.values()).index(prop)
-            self.curr_prop = self.properties_dict.get(list(self.properties_dict.keys())
-                                                      [(curr_index - 1 if curr_index == len(self.properties_dict)
-                                                        else curr_index)])
-        prop.close()
+        name = self._findName(kwargs)
+        if name is None:
+            path = str(kwargs.get('absolute_path', False) or kwargs.get('relative_path', ''))
+            return print(f"Property {clean_path(path).split(self.platformSeparator)[-1]} not loaded. Skipping...")
+        self.properties_dict[name].close()
 
+    @_locked
     def closeProps(self):
         for prop in self.properties_dict.values():
             prop.close()
+
+    def flushAll(self, workers: int = 8, fsync: bool = True) -> dict[str, dict]:
+        """Writes the Properties objects with changes (see Properties.hasChanges) to their files with writeBack, on a
+        pool of threads, the objects are not cleared
+        :param workers: maximum number of files written at the same time
+        :param fsync: if True the written files (and their directories) are flushed to disk once all are written
+        :return: dict of name -> {'path', 'mode' (returned by writeBack, None on error), 'duration' in seconds,
+        'error' (None or the exception raised)}
+        """
+        start = time.perf_counter()
+        pending = [(name, prop) for name, prop in list(self.properties_dict.items()) if prop.hasChanges()]
+        results = {}
+
+        def write(item: tuple[str, Properties]):
+            name, prop = item
+            result = {'path': prop.getPath(), 'mode': None, 'duration': 0.0, 'error': None}
+            file_start = time.perf_counter()
+            try:
+                if not prop.getPath():
+                    raise ValueError('No path set')
+                result['mode'] = prop.writeBack(fsync=False)
+            except Exception as e:
+                result['error'] = e
+                logger.warning("Could not write '%s': %s", name, e)
+            result['duration'] = time.perf_counter() - file_start
+            results[name] = result
+
+        with ThreadPoolExecutor(max(1, workers)) as executor:
+            list(executor.map(write, pending))
+            if fsync:
+                written = [result['path'] for result in results.values() if result['mode'] is not None]
+                directories = {os.path.dirname(path) for path in written}  ## Atomic rewrites renamed the files
+                for path, error in zip(written + list(directories), executor.map(_fsync, written + list(directories))):
+                    if error is not None:
+                        logger.warning("Could not flush '%s' to disk: %s", path, error)
+        if _event_hooks or logger.isEnabledFor(logging.DEBUG):
+            _emit({'event': 'flushed', 'files': len(results),
+                   'errors': sum(result['error'] is not None for result in results.values()),
+                   'duration': time.perf_counter() - start},
+                  'Flushed %(files)d files (%(errors)d errors) in %(duration).6fs')
+        return {name: results[name] for name, _ in pending}
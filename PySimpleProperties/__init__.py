@@ -1,5 +1,5 @@
 try:
     import copy
-    from collections import KeysView, ValuesView
+    from collections.abc import KeysView, ValuesView
 except ModuleNotFoundError as e:
     raise ModuleNotFoundError('Module not found\n' + str(e))
@@ -0,0 +1,206 @@
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from typing import Optional
+
+from .Properties import PropertiesHandler, _emit, _event_hooks, _stat_signature, getPlatformSeparators, logger
+
+
+class _Inotify:
+    """Minimal inotify binding (Linux) through ctypes, reports the names of changed entries of watched directories"""
+    _EVENT = struct.Struct('iIII')  ## wd, mask, cookie, len, followed by the name padded with null bytes
+    _MASK = 0x2 | 0x8 | 0x40 | 0x80 | 0x100 | 0x200  ## MODIFY, CLOSE_WRITE, MOVED_FROM, MOVED_TO, CREATE, DELETE
+    _OVERFLOW = 0x4000
+
+    def __init__(self):
+        import ctypes  ## Only imported when inotify is used
+        import ctypes.util
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._watches = {}  ## directory -> watch descriptor
+        self._directories = {}  ## watch descriptor -> directory
+
+    def sync(self, directories: list[str]):
+        """Watches exactly the given directories"""
+        for directory in set(self._watches) - set(directories):
+            wd = self._watches.pop(directory)
+            self._directories.pop(wd, None)
+            self._libc.inotify_rm_watch(self._fd, wd)
+        for directory in directories:
+            if directory not in self._watches:
+                wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), self._MASK)
+                if wd >= 0:
+                    self._watches[directory] = wd
+                    self._directories[wd] = directory
+
+    def read(self, timeout: float) -> Optional[list[str]]:
+        """Waits up to timeout seconds for events
+        :return: list of changed paths, None if events were lost and every file must be checked
+        """
+        if not select.select([self._fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self._fd, 1 << 16)
+        except BlockingIOError:
+            return []
+        paths = []
+        pos = 0
+        while pos < len(data):
+            wd, mask, _, length = self._EVENT.unpack_from(data, pos)
+            pos += self._EVENT.size
+            name = data[pos:pos + length].rstrip(b'\0')
+            pos += length
+            if mask & self._OVERFLOW:
+                return None
+            if name and wd in self._directories:
+                paths.append(self._directories[wd] + os.fsdecode(name))
+        return paths
+
+    def close(self):
+        os.close(self._fd)
+
+
+class DirectoryWatcher:
+    handler: 'PropertiesHandler'
+    interval: float
+    debounce: float
+    _inotify: Optional[_Inotify]  ## None when polling
+    _signatures: dict[str, tuple]  ## Polling only, path -> stat signature at the previous scan
+    _thread: Optional[threading.Thread]
+    _stop: threading.Event
+
+    def __init__(self, handler: 'PropertiesHandler', interval: float = 1.0, debounce: float = 0.2,
+                 use_inotify: bool = None):
+        """ Watches the directories registered in a PropertiesHandler from a background thread: changed files are
+        reloaded, new .properties files are added and deleted ones are removed. A file is only handled once it stayed
+        untouched for debounce seconds, and as its content is parsed into a new dict which then replaces the previous
+        one, other threads always see either the old or the new content
+        :param handler: PropertiesHandler whose directories_dict is watched
+        :param interval: seconds between two scans when polling
+        :param debounce: seconds a file must stay untouched before its change is applied
+        :param use_inotify: True to require inotify, False to poll, None uses inotify when available
+        """
+        self.handler = handler
+        self.interval = interval
+        self.debounce = debounce
+        self._inotify = None
+        if use_inotify or (use_inotify is None and sys.platform.startswith('linux')):
+            try:
+                self._inotify = _Inotify()
+            except (OSError, AttributeError):
+                if use_inotify:
+                    raise
+                logger.debug('inotify not available, polling directories')
+        self._signatures = {}
+        self._thread = None
+        self._stop = threading.Event()
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}, mode={'inotify' if self._inotify else 'polling'}, " \
+               f"alive={self.isAlive()}>"
+
+    def __enter__(self) -> 'DirectoryWatcher':
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self) -> 'DirectoryWatcher':
+        """Starts the watching thread, the handler is made thread safe first
+        :return: self
+        """
+        self.handler._makeThreadSafe()
+        if self._inotify is not None:
+            self._inotify.sync(self._directories())
+        else:
+            self._scan(self._directories())
+        self._thread = threading.Thread(target=self._run, name='PropertiesWatcher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = None):
+        """Stops the watching thread, changes still waiting for their debounce delay are dropped"""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def isAlive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _directories(self) -> list[str]:
+        return list(self.handler.directories_dict.keys())
+
+    def _scan(self, directories: list[str]) -> list[str]:
+        """Polling: stats the .properties files of the directories
+        :return: paths created, changed or deleted since the previous scan
+        """
+        signatures = {}
+        for directory in directories:
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.name.endswith('.properties'):
+                            try:
+                                signatures[entry.path] = _stat_signature(entry.stat())
+                            except FileNotFoundError:
+                                pass
+            except FileNotFoundError:
+                pass
+        changed = [path for path, signature in signatures.items() if self._signatures.get(path) != signature]
+        changed.extend(path for path in self._signatures if path not in signatures)
+        self._signatures = signatures
+        return changed
+
+    def _allFiles(self, directories: list[str]) -> list[str]:
+        """Paths of every registered or present file, checked when inotify events were lost"""
+        paths = []
+        for directory in directories:
+            paths.extend(self.handler.directories_dict.get(directory, ()))
+            try:
+                paths.extend(directory + file for file in os.listdir(directory) if file.endswith('.properties'))
+            except FileNotFoundError:
+                pass
+        return paths
+
+    def _run(self):
+        pending = {}  ## path -> time of its last event
+        try:
+            while not self._stop.is_set():
+                directories = self._directories()
+                timeout = min(self.interval, self.debounce) if pending else self.interval
+                if self._inotify is not None:
+                    self._inotify.sync(directories)
+                    paths = self._inotify.read(timeout)
+                    if paths is None:
+                        paths = self._allFiles(directories)
+                elif self._stop.wait(timeout):
+                    break
+                else:
+                    paths = self._scan(directories)
+                now = time.monotonic()
+                for path in paths:
+                    pending[path] = now
+                for path in [path for path, last_event in pending.items() if now - last_event >= self.debounce]:
+                    del pending[path]
+                    self._apply(path)
+        finally:
+            if self._inotify is not None:
+                self._inotify.close()
+
+    def _apply(self, path: str):
+        directory = os.path.dirname(path) + getPlatformSeparators()
+        if not path.endswith('.properties') or directory not in self.handler.directories_dict:
+            return
+        try:
+            change = self.handler._updateFile(directory, path)
+        except Exception:
+            logger.exception("Could not update '%s'", path)
+            return
+        if change in ('added', 'changed', 'removed') and (_event_hooks or logger.isEnabledFor(logging.DEBUG)):
+            _emit({'event': 'file_changed', 'path': path, 'change': change}, 'Watched %(path)s: %(change)s')
@@ -0,0 +1,495 @@
+"""Small benchmark script, run from the repo root or the tests folder:
+    python tests/benchmark.py [name]
+Each benchmark runs when its name is given, or all of them run when no name is given."""
+import asyncio
+import contextlib
+import copy
+import fnmatch
+import io
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from PySimpleProperties.Properties import Interpolator, LayeredProperties, Properties, PropertiesHandler, \
+    clean_path, getPlatformSeparators
+
+
+def _write_properties(path: str, n_keys: int, multiline_every: int = 50):
+    with open(path, 'w') as f:
+        f.write('# generated file\n')
+        for i in range(n_keys):
+            if i % multiline_every == 0:
+                f.write(f'key.{i}=first part\\\n  second part\\\n  third part\n')
+            else:
+                f.write(f'key.{i}=value number {i}\n')
+
+
+def _load_once(path: str):
+    """Loads a single file and prints 'seconds peak_rss_kb', used in a fresh process so that peak RSS is per size"""
+    import resource  ## POSIX only, imported here so that the other benchmarks also run on Windows
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        Properties(path, is_absolute=True)
+        elapsed = time.perf_counter() - start
+    print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def bench_load():
+    """Load time and peak RSS of Properties.load for growing file sizes, both should grow linearly"""
+    print('## load: keys | size (MB) | seconds | peak RSS (MB)')
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_keys in (100_000, 200_000, 400_000, 800_000):
+            path = os.path.join(tmp, f'{n_keys}.properties')
+            _write_properties(path, n_keys)
+            out = subprocess.run([sys.executable, __file__, '_load_once', path],
+                                 capture_output=True, text=True, check=True).stdout.split()
+            size = os.path.getsize(path) / 1e6
+            print(f'{n_keys:>9} | {size:9.1f} | {float(out[0]):7.3f} | {int(out[1]) / 1024:8.1f}')
+
+
+def _timed(func, *args, **kwargs) -> float:
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        return time.perf_counter() - start
+
+
+def bench_directory():
+    """Startup of PropertiesHandler.setDirectory on a synthetic 5k files tree, serial vs parallel"""
+    print('## setDirectory, 5000 files: mode | seconds')
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(5000):
+            _write_properties(os.path.join(tmp, f'locale_{i}.properties'), 200)
+        for label, kwargs in (('serial', {}), ('4 threads', {'workers': 4}), ('8 threads', {'workers': 8}),
+                              ('4 processes', {'workers': 4, 'use_processes': True})):
+            print(f'{label:>12} | {_timed(PropertiesHandler().setDirectory, tmp, is_absolute=True, **kwargs):.3f}')
+
+
+def bench_snapshot():
+    """Cold (parsing) vs warm (snapshot or per file cache) startup of PropertiesHandler.setDirectory"""
+    print('## snapshot, 2000 files: mode | seconds')
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = os.path.join(tmp, 'locales')
+        os.mkdir(directory)
+        for i in range(2000):
+            _write_properties(os.path.join(directory, f'locale_{i}.properties'), 200)
+        snapshot = os.path.join(tmp, 'locales.snapshot')
+        print(f"{'cold':>22} | {_timed(PropertiesHandler().setDirectory, directory, is_absolute=True):.3f}")
+        for label in ('snapshot, first run', 'snapshot, warm'):
+            seconds = _timed(PropertiesHandler().setDirectory, directory, is_absolute=True, snapshot=snapshot)
+            print(f'{label:>22} | {seconds:.3f}')
+        files = [os.path.join(directory, f'locale_{i}.properties') for i in range(2000)]
+        cache_dir = os.path.join(tmp, 'cache')
+        for label in ('file cache, first run', 'file cache, warm'):
+            seconds = _timed(lambda: [Properties(file, is_absolute=True, cache_dir=cache_dir) for file in files])
+            print(f'{label:>22} | {seconds:.3f}')
+
+
+def _clean_path_recursive(uncleaned_path: str):
+    """Previous clean_path implementation, kept as the reference of the clean_path benchmark"""
+    def _cleaner(struct_path: list, index: int, first=False):
+        if index == len(struct_path):
+            return
+        if (not first) and struct_path[index] == "":
+            struct_path.pop(index)
+            return _cleaner(struct_path, index)
+        return _cleaner(struct_path, index + 1)
+
+    platformSeparator = getPlatformSeparators()
+    uncleaned_path = uncleaned_path.replace('/', '\\')
+    if not uncleaned_path.endswith("\\"):
+        uncleaned_path += "\\"
+    struct_path = uncleaned_path.split('\\')
+    i = 0
+    _cleaner(struct_path, 0, first=True)
+    while i < len(struct_path):
+        if struct_path[i] == '..':
+            struct_path.pop(i)
+            struct_path.pop(i)
+        else:
+            i += 1
+    path = struct_path[0] if struct_path else platformSeparator
+    for element in struct_path[1:]:
+        if element != '':
+            path += platformSeparator + element
+    return path
+
+
+def bench_clean_path():
+    """clean_path against the previous recursive implementation, microseconds per call"""
+    print('## clean_path: path | previous (us) | cached (us) | uncached (us)')
+    uncached = clean_path.__wrapped__
+    for path in (os.getcwd() + '/tests/tests2/Entity1.properties', '..///tests/tests2/', 'a/' * 40 + 'file.properties'):
+        runs = 20000
+        previous = timeit.timeit(lambda: _clean_path_recursive(path), number=runs) / runs * 1e6
+        cached = timeit.timeit(lambda: clean_path(path), number=runs) / runs * 1e6
+        current = timeit.timeit(lambda: uncached(path), number=runs) / runs * 1e6
+        label = path if len(path) < 40 else path[:37] + '...'
+        print(f'{label:>40} | {previous:13.2f} | {cached:11.2f} | {current:13.2f}')
+
+
+def bench_construction():
+    """Import time of the module (in a fresh process) and Properties construction throughput"""
+    code = 'import time; start = time.perf_counter(); import PySimpleProperties.Properties; ' \
+           'print(time.perf_counter() - start)'
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    seconds = [float(subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                                    cwd=root).stdout) for _ in range(5)]
+    print(f'## import: best of 5 | {min(seconds) * 1000:.2f} ms')
+    runs = 200_000
+    seconds = timeit.timeit(Properties, number=runs)
+    print(f'## Properties(): {runs / seconds:,.0f} objects/s')
+    seconds = timeit.timeit(PropertiesHandler, number=runs)
+    print(f'## PropertiesHandler(): {runs / seconds:,.0f} objects/s')
+
+
+class _DictProperties(Properties):
+    """Properties with a __dict__ holding the former per-instance attributes, like the objects before slots"""
+
+    def __init__(self, path: str = False, **kwargs):
+        super().__init__(path, **kwargs)
+        self.__dict__.update(prev_key='', platformSeparator=getPlatformSeparators())
+
+
+def bench_memory():
+    """Memory held by 50k small per-tenant Properties objects, measured with tracemalloc"""
+    print('## memory, 50000 objects of 20 keys: layout | MB')
+    with tempfile.TemporaryDirectory() as tmp:
+        files = []
+        for i in range(10):
+            files.append(os.path.join(tmp, f'tenant_{i}.properties'))
+            _write_properties(files[-1], 20)
+        for label, cls, kwargs in (('__dict__', _DictProperties, {}), ('slots', Properties, {}),
+                                   ('slots + intern_keys', Properties, {'intern_keys': True})):
+            tracemalloc.start()
+            props = [cls(files[i % 10], is_absolute=True, **kwargs) for i in range(50_000)]
+            size = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            del props
+            print(f'{label:>20} | {size / 1e6:.1f}')
+
+
+def bench_clone():
+    """Per request overrides on a 100k keys base: deep copy against the copy-on-write clone"""
+    print('## clone, 100k keys base and 3 overrides: mode | us per clone | MB for 100 clones')
+    base = Properties()
+    for i in range(100_000):
+        base.setProperty(f'key.{i}', f'value number {i}')
+
+    for label, clone in (('deepcopy', lambda: copy.deepcopy(base)), ('copy-on-write', base.clone)):
+        def request():
+            prop = clone()
+            for key in ('key.1', 'key.2', 'tenant'):
+                prop.setProperty(key, 'override')
+            return prop
+        runs = 20
+        seconds = timeit.timeit(request, number=runs) / runs
+        tracemalloc.start()
+        clones = [request() for _ in range(100)]
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del clones
+        print(f'{label:>14} | {seconds * 1e6:12.1f} | {size / 1e6:.2f}')
+
+
+def bench_layered():
+    """Resolving keys through tenant, environment and defaults: probing each layer against LayeredProperties"""
+    print('## layered, 3 layers: mode | ns per key')
+    defaults, environment, tenant = Properties(), Properties(), Properties()
+    for i in range(10_000):
+        defaults.setProperty(f'key.{i}', 'default')
+        if i % 10 == 0:
+            environment.setProperty(f'key.{i}', 'environment')
+        if i % 100 == 0:
+            tenant.setProperty(f'key.{i}', 'tenant')
+    keys = [f'key.{i}' for i in range(10_000)]
+
+    def probe():
+        for key in keys:
+            for layer in (tenant, environment, defaults):
+                value = layer.getProperty(key)
+                if value != 'Undefined':
+                    break
+
+    layered = LayeredProperties([tenant, environment, defaults])
+    for label, func in (('probing', probe), ('getProperty', lambda: [layered.getProperty(key) for key in keys]),
+                        ('getMany', lambda: layered.getMany(keys))):
+        seconds = min(timeit.repeat(func, number=10, repeat=3)) / 10
+        print(f'{label:>12} | {seconds / len(keys) * 1e9:.0f}')
+
+
+def _write_version(path: str, version: int, n_keys: int):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(f'version={version}\n' + ''.join(f'key.{i}={version}\n' for i in range(n_keys)))
+    os.replace(tmp_path, path)
+
+
+def bench_stress(seconds: float = 3.0):
+    """Stress test: reader threads check that every content they see is complete and from a single version of its
+    file, while writers rewrite and reload the files and add, remove and switch Properties objects"""
+    print('## stress, 8 readers: mode | reads | reloads | handler changes | errors')
+    for label, lazy in (('eager', False), ('lazy, max_loaded=5', True)):
+        with tempfile.TemporaryDirectory() as tmp:
+            names = [f'locale_{i}' for i in range(20)]
+            for name in names:
+                _write_version(os.path.join(tmp, name + '.properties'), 0, 500)
+            handler = PropertiesHandler(name_by_stem=True, max_loaded=5, thread_safe=True)
+            handler.setDirectory(tmp, is_absolute=True, lazy=lazy)
+            stop = threading.Event()
+            counts = {'reads': 0, 'reloads': 0, 'changes': 0}
+            errors = []
+
+            def reader():
+                reads = 0
+                while not stop.is_set():
+                    try:
+                        content = handler.getProperty(name=random.choice(names)).getContent()
+                        version = content['version']
+                        if len(content) != 501 or any(value != version for value in content.values()):
+                            errors.append(f'mixed or partial content of {len(content)} keys')
+                        handler.get()
+                    except Exception as e:
+                        errors.append(repr(e))
+                    reads += 1
+                counts['reads'] += reads
+
+            def reloader():
+                version = 0
+                while not stop.is_set():
+                    version += 1
+                    _write_version(os.path.join(tmp, random.choice(names) + '.properties'), version, 500)
+                    counts['reloads'] += len(handler.reloadAll())
+
+            def changer():
+                while not stop.is_set():
+                    handler.addProperty(Properties(), 'extra')
+                    handler.switchUp()
+                    handler.removeProperty(name='extra')
+                    handler.switchDown()
+                    counts['changes'] += 4
+
+            threads = [threading.Thread(target=reader) for _ in range(8)]
+            threads += [threading.Thread(target=reloader), threading.Thread(target=changer)]
+            with contextlib.redirect_stdout(io.StringIO()):
+                for thread in threads:
+                    thread.start()
+                time.sleep(seconds)
+                stop.set()
+                for thread in threads:
+                    thread.join()
+            print(f"{label:>20} | {counts['reads']:>8} | {counts['reloads']:>7} | {counts['changes']:>15} | "
+                  f"{len(errors)}")
+            for error in sorted(set(errors))[:5]:
+                print('    ', error)
+            assert not errors, f'stress ({label}): {len(errors)} errors'
+
+
+async def _longest_stall(coroutine) -> tuple[float, float]:
+    """Runs coroutine next to a ticker
+    :return: (seconds taken by coroutine, longest time the event loop did not run the ticker)
+    """
+    stalls = [0.0]
+    done = asyncio.Event()
+
+    async def ticker():
+        last = time.perf_counter()
+        while not done.is_set():
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            stalls[0] = max(stalls[0], now - last)
+            last = now
+
+    task = asyncio.ensure_future(ticker())
+    await asyncio.sleep(0)  ## Lets the ticker start
+    start = time.perf_counter()
+    await coroutine
+    elapsed = time.perf_counter() - start
+    done.set()
+    await task
+    return elapsed, stalls[0]
+
+
+def bench_async():
+    """Loading a 2000 files directory from an event loop: addDirectory blocks it, aaddDirectory doesn't"""
+    print('## async, 2000 files: mode | seconds | longest event loop stall (ms)')
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(2000):
+            _write_properties(os.path.join(tmp, f'locale_{i}.properties'), 200)
+
+        async def blocking():
+            PropertiesHandler().addDirectory(tmp, is_absolute=True)
+
+        for label, coroutine in (('addDirectory', blocking),
+                                 ('aaddDirectory', lambda: PropertiesHandler().aaddDirectory(tmp, is_absolute=True))):
+            with contextlib.redirect_stdout(io.StringIO()):
+                elapsed, stall = asyncio.run(_longest_stall(coroutine()))
+            print(f'{label:>14} | {elapsed:7.3f} | {stall * 1000:.1f}')
+
+
+def bench_typed():
+    """Repeated typed reads: converting getProperty on each read against the cached typed getters"""
+    print('## typed getters: read | ns per read')
+    prop = Properties()
+    prop.setProperty('workers', 16)
+    prop.setProperty('enabled', 'yes')
+    prop.setProperty('hosts', 'a.example.com, b.example.com, c.example.com')
+    for label, func in (('int(getProperty)', lambda: int(prop.getProperty('workers'))),
+                        ('getInt', lambda: prop.getInt('workers')),
+                        ('split(getProperty)', lambda: [host.strip() for host in prop.getProperty('hosts').split(',')]),
+                        ('getList', lambda: prop.getList('hosts')),
+                        ('getBool', lambda: prop.getBool('enabled'))):
+        runs = 1_000_000
+        print(f'{label:>18} | {min(timeit.repeat(func, number=runs, repeat=3)) / runs * 1e9:.0f}')
+
+
+def _expand(prop: Properties, value: str) -> str:
+    """Expansion done by callers before the Interpolator: scanning and recursing on every read"""
+    return re.sub(r'\$\{([^${}]+)\}', lambda match: _expand(prop, prop.getProperty(match.group(1))), value)
+
+
+def bench_interpolation():
+    """Reading values with ${key} references three levels deep: expanding on every read against the Interpolator"""
+    print('## interpolation, 10k keys: read | us per read')
+    prop = Properties()
+    prop.setProperty('host', 'example.com')
+    prop.setProperty('base', 'https://${host}')
+    for i in range(10_000):
+        prop.setProperty(f'api.{i}', f'${{base}}/api/v{i % 3}')
+        prop.setProperty(f'url.{i}', f'${{api.{i}}}/item/{i}')
+    keys = [f'url.{i}' for i in range(10_000)]
+    interpolator = Interpolator(prop)
+    for label, func in (('re-scan', lambda: [_expand(prop, prop.getProperty(key)) for key in keys]),
+                        ('first read', lambda: [interpolator.get(key) for key in keys]),
+                        ('cached', lambda: [interpolator.get(key) for key in keys])):
+        print(f'{label:>10} | {timeit.timeit(func, number=1) / len(keys) * 1e6:.2f}')
+    prop.setProperty('host', 'example.org')
+    seconds = timeit.timeit(lambda: [interpolator.get(key) for key in keys], number=1)
+    print(f"{'changed':>10} | {seconds / len(keys) * 1e6:.2f}")
+
+
+def bench_writeback():
+    """Writing one changed key of a 200k keys file: out(atomic=True) against writeBack"""
+    print('## writeback, 200k keys: change | out(atomic=True) ms | writeBack ms | writeBack mode')
+    with tempfile.TemporaryDirectory() as tmp:
+        props = []
+        for name in ('out', 'writeback'):
+            _write_properties(os.path.join(tmp, name + '.properties'), 200_000)
+            props.append(Properties(os.path.join(tmp, name + '.properties'), is_absolute=True))
+        full, patched = props
+        patched.setProperty('key.199999', 'value number 199999')
+        patched.writeBack()  ## Finds the offsets, they are then kept up to date
+        for label, key in (('near the end', 'key.199990'), ('new key', 'new.key'), ('near the start', 'key.10')):
+            for prop in props:
+                prop.setProperty(key, 'changed')
+            seconds = _timed(full.out, atomic=True)
+            start = time.perf_counter()
+            mode = patched.writeBack()
+            print(f'{label:>15} | {seconds * 1000:17.1f} | {(time.perf_counter() - start) * 1000:12.1f} | {mode}')
+
+
+def bench_flush():
+    """Writing 50 changed files out of 200: closeProps against flushAll"""
+    print('## flush, 200 files of 2k keys, 50 changed: closeProps ms | flushAll ms | flushAll(fsync=False) ms')
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(200):
+            _write_properties(os.path.join(tmp, f'file{i}.properties'), 2_000)
+        handler = PropertiesHandler()
+        handler.setDirectory(tmp, is_absolute=True)
+        props = list(handler.properties_dict.values())
+        timings = []
+        for flush in (handler.closeProps, handler.flushAll, lambda: handler.flushAll(fsync=False)):
+            for prop in props[::4]:
+                prop.setProperty('key.1999', 'changed')
+            timings.append(_timed(flush))
+        print(f'{timings[0] * 1000:16.1f} | {timings[1] * 1000:11.1f} | {timings[2] * 1000:24.1f}')
+
+
+def bench_prefix():
+    """Prefix, glob and namespace queries on a 1M keys file: scanning getKeySet against the sorted key index"""
+    print('## prefix, 1M keys: query | scan ms | index ms | results')
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'prefix.properties')
+        with open(path, 'w') as f:
+            for i in range(1_000_000):
+                f.write(f'service{i % 1000}.group{i // 1000 % 100}.key{i}=value {i}\n')
+        prop = Properties(path, is_absolute=True)
+        print(f"{'first call (sort)':>28} | {'':>7} | {_timed(prop.getKeysByPrefix, 'service1.') * 1000:8.1f} |")
+        for i in range(1000):  ## Buffered in the index, merged in by a later query
+            prop.setProperty(f'service{i}.group0.new', 'new')
+        queries = (
+            ('getByPrefix service7.group3.', lambda: {key: prop.getProperty(key) for key in prop.getKeySet()
+                                                      if key.startswith('service7.group3.')},
+             lambda: prop.getByPrefix('service7.group3.')),
+            ('matchKeys service42.*.new', lambda: [key for key in prop.getKeySet()
+                                                   if fnmatch.fnmatchcase(key, 'service42.*.new')],
+             lambda: prop.matchKeys('service42.*.new')),
+            ('getTree service99', lambda: [key for key in prop.getKeySet() if key.startswith('service99.')],
+             lambda: prop.getTree('service99')),
+        )
+        for label, scan, indexed in queries:
+            seconds = min(_timed(indexed) for _ in range(3))  ## A collection of the 1M keys can land in one run
+            print(f'{label:>28} | {_timed(scan) * 1000:7.1f} | {seconds * 1000:8.3f} | {len(indexed())}')
+
+
+def bench_key_index():
+    """Which of 2000 locale files define a key, and the missing keys report, with and without key_index"""
+    print('## key_index, 2000 files of 500 keys: query | scan ms | index ms')
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(2000):
+            with open(os.path.join(tmp, f'locale{i}.properties'), 'w') as f:
+                f.writelines(f'message.{j}=text {j}\n' for j in range(500) if rng.random() > 0.001)
+        handlers = []
+        for key_index in (False, True):
+            handler = PropertiesHandler(name_by_stem=True, key_index=key_index)
+            seconds = _timed(handler.setDirectory, tmp, is_absolute=True)
+            handlers.append(handler)
+            print(f"{'setDirectory' + (' (key_index)' if key_index else ''):>26} | {seconds * 1000:.1f}")
+        scan, indexed = handlers
+        keys = [f'message.{j}' for j in range(500)]
+        for label, query in (('getNamesWithKey x500', lambda handler: [handler.getNamesWithKey(key) for key in keys]),
+                             ('getMissingKeys', lambda handler: handler.getMissingKeys()),
+                             ('getMissingKeys(locale0)', lambda handler: handler.getMissingKeys('locale0'))):
+            assert query(scan) == query(indexed)
+            print(f'{label:>26} | {_timed(query, scan) * 1000:7.1f} | {_timed(query, indexed) * 1000:8.1f}')
+        seconds = [_timed(lambda: [prop.setProperty(key, 'x') for key in keys * 20])
+                   for prop in (scan.getProperty(name='locale7'), indexed.getProperty(name='locale7'))]
+        print(f"{'setProperty x10000':>26} | {seconds[0] * 1000:7.1f} | {seconds[1] * 1000:8.1f}")
+
+
+BENCHMARKS = {
+    'load': bench_load,
+    'directory': bench_directory,
+    'snapshot': bench_snapshot,
+    'clean_path': bench_clean_path,
+    'construction': bench_construction,
+    'memory': bench_memory,
+    'clone': bench_clone,
+    'layered': bench_layered,
+    'stress': bench_stress,
+    'async': bench_async,
+    'typed': bench_typed,
+    'interpolation': bench_interpolation,
+    'writeback': bench_writeback,
+    'flush': bench_flush,
+    'prefix': bench_prefix,
+    'key_index': bench_key_index,
+}
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == '_load_once':
+        _load_once(sys.argv[2])
+    elif len(sys.argv) > 1:
+        BENCHMARKS[sys.argv[1]]()
+    else:
+        for bench in BENCHMARKS.values():
+            bench()
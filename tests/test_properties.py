@@ -0,0 +1,573 @@
+import asyncio
+import contextlib
+import gc
+import io
+import os
+import random
+import stat
+import threading
+import time
+import weakref
+
+import pytest
+
+from PySimpleProperties.Properties import Interpolator, LazyProperties, MappedProperties, Properties, \
+    PropertiesHandler, _Entries, _scan_offsets, addEventHook, removeEventHook
+from PySimpleProperties.watcher import DirectoryWatcher
+
+import benchmark
+
+
+def _ranges(entries: _Entries) -> dict[str, tuple[int, int]]:
+    return {key: entries.range(entry) for key, entry in entries.index.items()}
+
+
+def _wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return condition()
+
+
+def test_out_writes_atomically_with_the_default_mode(tmp_path):
+    prop = Properties()
+    prop.setProperty('a', '1')
+    prop.setProperty('b', 'two')
+    path = str(tmp_path / 'new.properties')
+    prop.out(path, is_absolute=True, atomic=True)
+    umask = os.umask(0o022)
+    os.umask(umask)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o666 & ~umask
+    assert Properties(path, is_absolute=True).getContent() == {'a': '1', 'b': 'two'}
+    os.chmod(path, 0o640)
+    prop.setProperty('a', '3')
+    prop.out(path, is_absolute=True, atomic=True)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o640
+    assert Properties(path, is_absolute=True).getProperty('a') == '3'
+    assert os.listdir(tmp_path) == ['new.properties']
+
+def test_thread_safe_handler_keeps_its_indexes():
+    handler = PropertiesHandler(thread_safe=True)
+
+    def worker(n):
+        for i in range(200):
+            prop = Properties()
+            handler.addProperty(prop, f'w{n}_{i}')
+            handler.switchUp()
+            if i % 2:
+                handler.removeProperty(name=f'w{n}_{i}')
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(handler._order) == sorted(handler.getNames()) and len(handler._order) == 400
+    for name, prop in handler.properties_dict.items():
+        assert handler.getName(prop) == name
+
+
+def test_stress():
+    with contextlib.redirect_stdout(io.StringIO()):
+        benchmark.bench_stress(seconds=1.0)
+
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_update_directory_reports_each_change(tmp_path, lazy):
+    for name in 'abc':
+        (tmp_path / f'{name}.properties').write_text(f'k={name}\n')
+    handler = PropertiesHandler(name_by_stem=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        handler.setDirectory(str(tmp_path), is_absolute=True, lazy=lazy)
+        directory = str(tmp_path) + os.sep
+        stat_b = os.stat(tmp_path / 'b.properties')
+        (tmp_path / 'b.properties').write_text('k=B\n')  ## Same size, mtime restored: only a hash tells
+        os.utime(tmp_path / 'b.properties', ns=(stat_b.st_atime_ns, stat_b.st_mtime_ns))
+        (tmp_path / 'c.properties').unlink()
+        (tmp_path / 'd.properties').write_text('k=d\n')
+        report = handler.updateDirectory(absolute_path=directory, check_hash=True)
+    assert report['added'] == [directory + 'd.properties']
+    assert report['removed'] == [directory + 'c.properties']
+    assert directory + 'b.properties' in report['changed']
+    assert sorted(handler.getNames()) == ['a', 'b', 'd']
+    assert handler.getProperty(name='b').getProperty('k') == 'B'
+    report = handler.updateDirectory(absolute_path=directory)
+    assert report == {'added': [], 'changed': [], 'removed': [],
+                      'unchanged': [directory + f'{name}.properties' for name in 'abd']}
+
+
+def test_reload_of_a_removed_file_keeps_the_content(tmp_path):
+    path = tmp_path / 'a.properties'
+    path.write_text('k=1\n')
+    handler = PropertiesHandler()
+    handler.addProperty(Properties(str(path), is_absolute=True), 'a')
+    path.unlink()
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert handler.reloadAll() == []
+    assert handler.getProperty(name='a').getProperty('k') == '1'
+
+
+def test_path_lookups_follow_loads_from_another_path(tmp_path):
+    a, b = str(tmp_path / 'a.properties'), str(tmp_path / 'b.properties')
+    for path in (a, b):
+        with open(path, 'w') as f:
+            f.write('k=v\n')
+    handler = PropertiesHandler()
+    moved, pathless = Properties(a, is_absolute=True), Properties()
+    handler.addProperty(moved, 'moved')
+    handler.addProperty(pathless, 'pathless')
+    moved.load(b, is_absolute=True)
+    pathless.load(a, is_absolute=True)
+    assert handler.getProperty(absolute_path=b) is moved
+    assert handler.getProperty(absolute_path=a) is pathless
+    handler.changeProperty(absolute_path=b)
+    assert handler.get() is moved
+    assert handler.removeProperty(absolute_path=a) is pathless
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert handler.getProperty(absolute_path=a) is None
+        pathless.load(b, is_absolute=True)  ## No longer stored, the handler stopped following it
+    assert handler.getProperty(absolute_path=b) is moved and not pathless._listeners
+
+
+@pytest.mark.parametrize('newline', ['\n', '\r\n'])
+def test_mapped_properties_parse_like_properties(tmp_path, newline):
+    rng = random.Random(2)
+    path = str(tmp_path / 'a.properties')
+    for trial in range(100):
+        lines = []
+        for i in range(rng.randint(0, 20)):
+            r = rng.random()
+            if r < 0.1:
+                lines.append(f'# comment {i}  ')
+            elif r < 0.15:
+                lines.append(rng.choice(['', '   ']))
+            elif r < 0.35:
+                lines.append(f'  k{rng.randint(0, 10)}= multi \\  {newline}   cont {i}\\{newline}   end  ')
+            else:
+                lines.append(f'k{rng.randint(0, 10)}=v{i}' + rng.choice(['', ' ', '\\']))
+        with open(path, 'w', newline='') as f:
+            f.write(newline.join(lines) + rng.choice(['', newline]))
+        prop, mapped = Properties(path, is_absolute=True), MappedProperties(path, is_absolute=True)
+        assert dict(mapped.getContent()) == prop.getContent()
+        assert mapped.comments == prop.comments
+        mapped.clear()
+
+
+def test_mapped_properties_are_read_only(tmp_path, caplog):
+    path = tmp_path / 'a.properties'
+    path.write_text('a=1\n')
+    mapped = MappedProperties(str(path), is_absolute=True)
+    with pytest.raises(TypeError):
+        mapped.setProperty('a', '2')
+    assert mapped.getProperty('a') == '1' and mapped.clone().getContent()['a'] == '1'
+    MappedProperties(str(tmp_path / 'missing.properties'), is_absolute=True)
+    assert 'File not found' in caplog.text
+
+
+@pytest.mark.parametrize('use_inotify', [False, None])
+def test_watcher_applies_changes(tmp_path, use_inotify):
+    (tmp_path / 'a.properties').write_text('k=1\n')
+    handler = PropertiesHandler(name_by_stem=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        handler.setDirectory(str(tmp_path), is_absolute=True)
+        watcher = handler.watch(interval=0.05, debounce=0.05, use_inotify=use_inotify)
+        try:
+            assert isinstance(watcher, DirectoryWatcher) and watcher.isAlive()
+            assert isinstance(handler._lock, type(threading.RLock()))  ## The watcher changes the handler too
+            (tmp_path / 'b.properties').write_text('k=new\n')
+            assert _wait_for(lambda: 'b' in handler.getNames())
+            (tmp_path / 'a.properties').write_text('k=2\n')
+            os.utime(tmp_path / 'a.properties', ns=(0, time.time_ns() + 10 ** 9))
+            assert _wait_for(lambda: handler.getProperty(name='a').getProperty('k') == '2')
+            os.remove(tmp_path / 'b.properties')
+            assert _wait_for(lambda: 'b' not in handler.getNames())
+        finally:
+            handler.stopWatching()
+    assert not watcher.isAlive()
+
+
+def test_typed_getters_follow_changes(tmp_path):
+    path = tmp_path / 'a.properties'
+    path.write_text('n=1\nflag=yes\nitems=a, b,,c\n')
+    prop = Properties(str(path), is_absolute=True)
+    assert (prop.getInt('n'), prop.getBool('flag'), prop.getList('items')) == (1, True, ['a', 'b', 'c'])
+    assert prop.getInt('missing', 7) == 7
+    with pytest.raises(ValueError):
+        prop.getInt('flag')
+    prop.setProperty('n', '2')
+    assert prop.getInt('n') == 2 and prop.getFloat('n') == 2.0
+    path.write_text('n=3\nflag=off\n')
+    prop.reload()
+    assert (prop.getInt('n'), prop.getBool('flag'), prop.getList('items')) == (3, False, None)
+
+    lazy = LazyProperties(str(path), is_absolute=True)
+    assert lazy.getInt('n') == 3
+    lazy.unload()
+    path.write_text('n=4\n')
+    assert lazy.getInt('n') == 4
+
+
+def test_typed_getters_do_not_cache_values_of_replaced_content():
+    prop = Properties()
+    prop.setProperty('n', '1')
+
+    def convert(value):  ## Another thread changing the content while the value is converted
+        prop.setProperty('n', '2')
+        return int(value)
+
+    assert prop._getTyped('n', int, convert, None) == 1
+    assert prop.getInt('n') == 2
+
+
+def test_interpolator_detects_cycles():
+    prop = Properties()
+    for key, value in (('a', '${b}'), ('b', '${c}/x'), ('c', '${a}'), ('d', '${e} ${missing}'), ('e', 'ok')):
+        prop.setProperty(key, value)
+    interpolator = Interpolator(prop)
+    assert interpolator.get('d') == 'ok ${missing}'
+    with pytest.raises(ValueError):
+        interpolator.get('a')
+    assert [sorted(cycle[:-1]) for cycle in interpolator.findCycles()] == [['a', 'b', 'c']]
+    prop.setProperty('c', 'end')
+    assert interpolator.get('a') == 'end/x' and interpolator.findCycles() == []
+
+
+def test_interpolator_detects_cycles_across_files():
+    first, second = Properties(), Properties()
+    first.setProperty('a', '${second:b}')
+    second.setProperty('b', '${first:a}')
+    handler = PropertiesHandler()
+    handler.addProperty(first, 'first')
+    handler.addProperty(second, 'second')
+    interpolator = Interpolator(handler)
+    with pytest.raises(ValueError):
+        interpolator.get('a', name='first')
+    assert len(interpolator.findCycles()) == 1
+
+
+def test_interpolators_are_not_kept_alive_by_their_properties():
+    prop = Properties()
+    prop.setProperty('a', '${b}')
+    prop.setProperty('b', 'x')
+    for _ in range(3):
+        interpolator = Interpolator(prop)
+        assert interpolator.get('a') == 'x'
+        reference = weakref.ref(interpolator)
+        del interpolator
+        gc.collect()
+        assert reference() is None
+    prop.setProperty('b', 'y')  ## Dead listeners remove themselves
+    assert not prop._listeners
+
+
+def test_entries_match_a_list_of_ranges():
+    """The Fenwick tree of _Entries against plain lists of starts and sizes"""
+    rng = random.Random(0)
+    entries, starts, sizes = _Entries(), [], []
+    for step in range(3000):
+        if rng.random() < 0.3 or not sizes:
+            start = starts[-1] + sizes[-1] if sizes else 0
+            entries.add(f'k{len(sizes)}', start, rng.randint(1, 20))
+            starts.append(start)
+            sizes.append(entries.sizes[-1])
+        else:
+            entry = rng.randrange(len(sizes))
+            if not sizes[entry]:
+                continue
+            size = rng.randint(0, 30)
+            entries.resize(entry, size)
+            for after in range(entry + 1, len(sizes)):
+                starts[after] += size - sizes[entry]
+            sizes[entry] = size
+        entry = rng.randrange(len(sizes))
+        assert entries.range(entry) == (starts[entry], starts[entry] + sizes[entry])
+    live = [entry for entry, size in enumerate(sizes) if size]
+    assert entries.last() == (live[-1] if live else None)
+
+
+def test_entries_find_duplicates_and_open_end(tmp_path):
+    path = tmp_path / 'a.properties'
+    path.write_bytes(b'a=1\n# comment\nb=2\\\n  more\na=3\n\nc=open\\')
+    with open(path, 'rb') as f:
+        entries = _scan_offsets(f, b'=', b'#')
+    assert entries.duplicates == {'a'} and entries.open_end
+    assert entries.entries('a') == [0, 2]
+    assert _ranges(entries) == {'a': (26, 30), 'b': (14, 26), 'c': (31, 38)}
+
+
+def test_write_back_keeps_the_file_formatting(tmp_path):
+    """writeBack against loading the file again, over random edits of random files"""
+    rng = random.Random(1)
+    path = tmp_path / 'a.properties'
+    modes = set()
+    for trial in range(150):
+        lines = []
+        for i in range(rng.randint(0, 30)):
+            r = rng.random()
+            if r < 0.1:
+                lines.append(f'# comment {i}')
+            elif r < 0.15:
+                lines.append('')
+            elif r < 0.25:
+                lines.append(f'  k{rng.randint(0, 40)}=multi\\\n   cont {i}\\\n   end')
+            else:
+                lines.append(f'k{rng.randint(0, 40)}=v{i}')
+        text = '\n'.join(lines) + ('\n' if rng.random() < 0.8 else '')
+        if rng.random() < 0.05:
+            text = text.rstrip('\n') + '\nkz=open\\'
+        path.write_text(text)
+        prop = Properties(str(path), is_absolute=True)
+        for _ in range(3):
+            for _ in range(rng.randint(1, 4)):
+                key = f'k{rng.randint(0, 45)}'
+                if rng.random() < 0.6:
+                    prop.setProperty(key, f'new{trial}')
+                elif prop.containsProperty(key):
+                    prop.removeProperty(key)
+            before = path.read_text()
+            modes.add(prop.writeBack(fsync=False))
+            after = path.read_text()
+            assert Properties(str(path), is_absolute=True).getContent() == prop.getContent()
+            assert [line for line in before.splitlines() if not line.strip() or line.startswith('#')] == \
+                   [line for line in after.splitlines() if not line.strip() or line.startswith('#')]
+            assert not prop.isModified()
+            if prop._offsets is not None:
+                with open(path, 'rb') as f:
+                    assert _ranges(_scan_offsets(f, b'=', b'#')) == _ranges(prop._offsets)
+    assert modes >= {'appended', 'patched', 'rewritten'}
+
+
+def test_write_back_rewrites_a_file_changed_on_disk(tmp_path):
+    path = tmp_path / 'a.properties'
+    path.write_text('a=1\nb=2\n')
+    prop = Properties(str(path), is_absolute=True)
+    path.write_text('a=1\nb=2\nc=3\n')
+    prop.setProperty('a', 'changed')
+    assert prop.writeBack(fsync=False) == 'rewritten'
+    assert Properties(str(path), is_absolute=True).getContent() == {'a': 'changed', 'b': '2'}
+
+
+def test_write_back_without_a_path_is_logged(caplog):
+    prop = Properties()
+    prop.setProperty('a', '1')
+    assert prop.writeBack() == 'unchanged'
+    assert 'no path set' in caplog.text
+
+
+def test_lazy_directory_parses_on_use_and_unloads_the_least_recently_used(tmp_path, caplog):
+    for name in 'abcd':
+        (tmp_path / f'{name}.properties').write_text(f'k={name}\n')
+    handler = PropertiesHandler(name_by_stem=True, max_loaded=2)
+    with contextlib.redirect_stdout(io.StringIO()):
+        handler.setDirectory(str(tmp_path), is_absolute=True, lazy=True)
+    props = dict(handler.properties_dict)
+    assert all(isinstance(prop, LazyProperties) and not prop.isLoaded() for prop in props.values())
+    assert [handler.getProperty(name=name).getProperty('k') for name in 'abc'] == ['a', 'b', 'c']
+    assert [name for name in 'abcd' if props[name].isLoaded()] == ['b', 'c']
+    (tmp_path / 'a.properties').write_text('k=new\n')
+    assert props['a'].getProperty('k') == 'new'  ## Parsed again, which unloads b
+    props['c'].setProperty('k', 'set')
+    props['d'].getContent()
+    assert [name for name in 'abcd' if props[name].isLoaded()] == ['a', 'c', 'd']  ## c is modified, so kept
+    assert props['c'].getProperty('k') == 'set'
+    LazyProperties(str(tmp_path / 'missing.properties'), is_absolute=True)
+    assert 'File not found' in caplog.text
+
+
+def test_automatic_names_reuse_the_smallest_free_number():
+    handler = PropertiesHandler()
+    handler.addProperty(Properties(), 'prop2')
+    handler.removeProperty(name='prop2')
+    handler.addProperty(Properties())
+    assert list(handler.getNames()) == ['prop1']
+    for _ in range(2):
+        handler.addProperty(Properties())
+    handler.removeProperty(name='prop2')
+    handler.addProperty(Properties())
+    handler.addProperty(Properties(), 'prop5')
+    handler.addProperty(Properties())
+    handler.addProperty(Properties())
+    assert sorted(handler.getNames()) == ['prop1', 'prop2', 'prop3', 'prop4', 'prop5', 'prop6']
+    handler.removeProperty(name='prop5')
+    handler.addProperty(Properties())
+    assert 'prop5' in handler.getNames() and len(handler.getNames()) == 6
+
+
+def test_switching_follows_the_order_of_the_names():
+    handler = PropertiesHandler()
+    props = {name: Properties() for name in 'abcd'}
+    for name, prop in props.items():
+        handler.addProperty(prop, name)
+    seen = []
+    for _ in range(5):
+        seen.append(handler.getName(handler.get()))
+        handler.switchUp()
+    assert seen == ['a', 'b', 'c', 'd', 'a']
+    handler.switchDown()
+    handler.switchDown()
+    assert handler.get() is props['d']
+    handler.removeProperty(name='a')  ## Before the current one
+    handler.switchDown()
+    assert handler.get() is props['c']
+    handler.removeProperty(name='c')  ## The current one, replaced by the previous one
+    assert handler.get() is props['b']
+    handler.changeProperty(index=-1)
+    handler.switchUp()
+    assert handler.get() is props['b']
+
+
+def test_parse_cache_and_snapshot_are_invalidated_by_changes(tmp_path):
+    directory, cache_dir = tmp_path / 'files', tmp_path / 'cache'
+    directory.mkdir()
+    cache_dir.mkdir()
+    for name in 'ab':
+        (directory / f'{name}.properties').write_text(f'k={name}\n')
+    path = str(directory / 'a.properties')
+    events = []
+    addEventHook(events.append)
+    try:
+        Properties(path, is_absolute=True, cache_dir=str(cache_dir))
+        assert Properties(path, is_absolute=True, cache_dir=str(cache_dir)).getProperty('k') == 'a'
+        assert [event['cached'] for event in events] == [False, True]
+        (directory / 'a.properties').write_text('k=changed\n')
+        assert Properties(path, is_absolute=True, cache_dir=str(cache_dir)).getProperty('k') == 'changed'
+        assert events[-1]['cached'] is False
+
+        snapshot = str(tmp_path / 'snapshot')
+        with contextlib.redirect_stdout(io.StringIO()):
+            PropertiesHandler().setDirectory(str(directory), is_absolute=True, snapshot=snapshot)
+            (directory / 'b.properties').write_text('k=longer value\n')
+            del events[:]
+            handler = PropertiesHandler(name_by_stem=True)
+            handler.setDirectory(str(directory), is_absolute=True, snapshot=snapshot)
+    finally:
+        removeEventHook(events.append)
+    assert [event['path'] for event in events] == [str(directory / 'b.properties')]  ## Only b is parsed again
+    assert handler.getProperty(name='a').getProperty('k') == 'changed'
+    assert handler.getProperty(name='b').getProperty('k') == 'longer value'
+
+
+def test_clones_copy_on_write():
+    prop = Properties()
+    for key, value in (('a', '1'), ('b', '2')):
+        prop.setProperty(key, value)
+    clone = prop.clone()
+    clone.setProperty('a', 'clone')
+    clone.removeProperty('b')
+    prop.setProperty('c', '3')
+    assert prop.getContent() == {'a': '1', 'b': '2', 'c': '3'}
+    assert clone.getProperty('a') == 'clone' and not clone.containsProperty('b') and not clone.containsProperty('c')
+    assert type(clone.getContent()) is dict and clone.getContent() == {'a': 'clone'}
+    second = clone.clone()
+    second.setProperty('d', '4')
+    assert clone.getContent() == {'a': 'clone'} and second.getContent() == {'a': 'clone', 'd': '4'}
+
+
+def test_layered_properties_follow_their_layers(tmp_path):
+    defaults_path = tmp_path / 'defaults.properties'
+    defaults_path.write_text('host=localhost\nport=80\n')
+    handler = PropertiesHandler()
+    handler.addProperty(Properties(str(defaults_path), is_absolute=True), 'defaults')
+    handler.addProperty(Properties(), 'tenant')
+    handler.getProperty(name='tenant').setProperty('port', '8080')
+    layered = handler.getLayered('tenant', 'defaults')
+    assert layered.getMany(['host', 'port', 'missing']) == {'host': 'localhost', 'port': '8080', 'missing': 'Undefined'}
+    handler.getProperty(name='tenant').setProperty('host', 'example.org')
+    assert layered.getProperty('host') == 'example.org'
+    handler.getProperty(name='tenant').removeProperty('port')
+    defaults_path.write_text('host=localhost\nport=81\n')
+    handler.getProperty(name='defaults').reload()
+    assert layered.getContent() == {'host': 'example.org', 'port': '81'} and layered.containsProperty('port')
+
+
+def test_async_api(tmp_path):
+    for name in 'ab':
+        (tmp_path / f'{name}.properties').write_text(f'k={name}\n')
+
+    async def scenario():
+        prop = await Properties().aload(str(tmp_path / 'a.properties'), is_absolute=True)
+        prop.setProperty('k', 'written')
+        await prop.aout(str(tmp_path / 'c.properties'), is_absolute=True, atomic=True)
+        handler = PropertiesHandler(name_by_stem=True)
+        await handler.aaddDirectory(str(tmp_path), is_absolute=True, concurrency=2)
+        (tmp_path / 'b.properties').unlink()
+        return handler, await handler.aupdateDirectory(absolute_path=str(tmp_path))
+
+    handler, report = asyncio.run(scenario())
+    assert {name: prop.getProperty('k') for name, prop in handler.properties_dict.items()} == \
+           {'a': 'a', 'c': 'written'}
+    assert report['removed'] == [str(tmp_path / 'b.properties')]
+
+
+def test_flush_all_writes_only_changed_files(tmp_path):
+    for name in 'abc':
+        (tmp_path / f'{name}.properties').write_text(f'# {name}\nk={name}\n')
+    handler = PropertiesHandler(name_by_stem=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        handler.setDirectory(str(tmp_path), is_absolute=True)
+    handler.getProperty(name='a').setProperty('k', 'A')
+    handler.getProperty(name='b').setProperty('new', 'x')
+    handler.addProperty(Properties(), 'pathless')
+    handler.getProperty(name='pathless').setProperty('k', 'v')
+    results = handler.flushAll(workers=2, fsync=False)
+    assert {name: (result['mode'], result['error'] is None) for name, result in results.items()} == \
+           {'a': ('patched', True), 'b': ('appended', True), 'pathless': (None, False)}
+    assert (tmp_path / 'a.properties').read_text() == '# a\nk=A\n'
+    assert (tmp_path / 'b.properties').read_text() == '# b\nk=b\nnew=x\n'
+    assert list(handler.flushAll(fsync=False)) == ['pathless']
+
+
+def test_prefix_queries_against_a_scan():
+    rng = random.Random(3)
+    prop = Properties()
+    for step in range(3000):
+        key = '.'.join(rng.choice(['db', 'dbx', 'cache', 'a']) for _ in range(rng.randint(1, 3)))
+        if rng.random() < 0.7:
+            prop.setProperty(key, str(step))
+        elif prop.containsProperty(key):
+            prop.removeProperty(key)
+        if step % 50 == 0:
+            for prefix in ('', 'db', 'db.', 'dbx.a', 'cache.db.', 'z'):
+                expected = sorted(key for key in prop.getKeySet() if key.startswith(prefix))
+                assert prop.getKeysByPrefix(prefix) == expected
+            assert prop.matchKeys('db.*.a') == sorted(key for key in prop.getKeySet()
+                                                      if key.startswith('db.') and key.endswith('.a') and
+                                                      key.count('.') >= 2)
+    prop = Properties()
+    for key, value in (('db.pool.size', '10'), ('db.pool', 'on'), ('db.host', 'h'), ('dbx', 'x')):
+        prop.setProperty(key, value)
+    assert prop.getTree('db') == {'pool': {'size': '10', '': 'on'}, 'host': 'h'}
+    assert prop.getByPrefix('db.pool') == {'db.pool': 'on', 'db.pool.size': '10'}
+
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_key_index_matches_a_scan(tmp_path, lazy):
+    for name, keys in (('en', 'abc'), ('fr', 'ab'), ('de', 'a')):
+        (tmp_path / f'{name}.properties').write_text(''.join(f'{key}=1\n' for key in keys))
+    indexed = PropertiesHandler(name_by_stem=True, key_index=True, max_loaded=1)
+    scanned = PropertiesHandler(name_by_stem=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for handler in (indexed, scanned):
+            handler.setDirectory(str(tmp_path), is_absolute=True, lazy=lazy)
+
+    def check():
+        for key in 'abcdz':
+            assert indexed.getNamesWithKey(key) == scanned.getNamesWithKey(key)
+            assert indexed.getNamesWithoutKey(key) == scanned.getNamesWithoutKey(key)
+        assert indexed.getMissingKeys() == scanned.getMissingKeys()
+        assert indexed.getMissingKeys('en') == scanned.getMissingKeys('en')
+
+    check()
+    assert indexed.getMissingKeys() == {'de': ['b', 'c'], 'fr': ['c']}
+    for handler in (indexed, scanned):
+        handler.getProperty(name='de').setProperty('d', '1')
+        handler.getProperty(name='fr').removeProperty('a')
+    check()
+    (tmp_path / 'en.properties').write_text('a=1\nz=1\n')
+    for handler in (indexed, scanned):
+        handler.reloadAll()
+        handler.removeProperty(name='fr')
+    check()
+    assert indexed.getNamesWithKey('z') == {'en'}